@@ -5,6 +5,7 @@ from datetime import datetime
 import threading
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
@@ -14,27 +15,47 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt, QTimer, QThread, QSize, QPoint, Signal
 from PySide6.QtGui import QImage, QPixmap, QMouseEvent
 from pypylon import pylon
-from pymodbus.client import ModbusSerialClient
+from vision_core import CameraSystem, LightSystem, SnapshotSaver, make_converter
 
 # =================== 설정 ===================
 TARGET_CAMS = [1, 2, 3, 4]
 PREVIEW_SCALE_WIDTH = 400
+PREVIEW_INTERVAL_MS = 33  # 카메라 프레임 간격을 알기 전 기본 미리보기 주기 (약 30 FPS)
+PREVIEW_MIN_INTERVAL_MS = 16  # 미리보기 최소 주기
+PREVIEW_MAX_INTERVAL_MS = 100  # 느린 카메라에서도 크기/모드 변경이 바로 반영되도록 상한
+FRAME_EMA_ALPHA = 0.1  # 프레임 간격 지수이동평균 가중치
+OFFLINE_CACHE_SIZE = 32  # 검은 화면 QPixmap 캐시 최대 개수
+TEXT_CACHE_SIZE = 64  # 미리 그려둔 텍스트 타일 캐시 최대 개수
 LIGHT_PORTS = ["COM2", "COM8", "COM9", "COM10"]
 BAUDRATE = 9600
 DEFAULT_SAVE_PATH = "./captured_images"
+LIGHT_SETTLE_SEC = 0.5  # 조명 변경 후 밝기가 안정될 때까지 대기 시간
+CAPTURE_INTERVAL_SEC = 0.2  # 시퀀스에서 촬영 후 다음 조명 변경까지 간격
 
 # 설정 파일 경로 (web과 동일한 위치 사용)
 SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "web", "config", "config.json")
 
 # =================== 전역 변수 ===================
+# latest_frames에는 카메라 스레드가 매번 새로 만든 배열만 넣고 이후 수정하지 않음
+# (dict 항목 교체는 GIL 하에서 원자적이므로 읽는 쪽은 락/복사 없이 참조만 가져감)
 latest_frames = {}
-frame_lock = threading.Lock()
+frame_seq = {}  # 카메라별 프레임 번호 (새 프레임이 저장될 때마다 증가)
+dropped_frames = {}  # 카메라별로 버린(오래된) 프레임 수
+frame_times = {}  # 카메라별 마지막 프레임 게시 시각 (perf_counter)
+frame_interval_ema = {}  # 카메라별 프레임 간격 평균 (ms)
+save_pool = ThreadPoolExecutor(max_workers=len(TARGET_CAMS))  # 카메라별 PNG 인코딩 병렬 처리
+write_pool = ThreadPoolExecutor(max_workers=1)  # 인코딩된 파일은 한 스레드에서 순서대로 디스크에 기록
+preview_pool = ThreadPoolExecutor(max_workers=len(TARGET_CAMS))  # 카메라별 미리보기 리사이즈 동시 처리
 running = True
-light_clients = {}
+camera_system = CameraSystem()
+light_system = LightSystem(LIGHT_PORTS, BAUDRATE)
+snapshot_saver = SnapshotSaver(TARGET_CAMS)
 cameras = None
 camera_map = {}
 converter = None
 cameras_available = False
+bgr_direct_cams = set()  # 카메라에서 BGR8로 바로 출력하는 카메라 (converter 불필요)
+converted_images = {}  # 카메라별 converter 출력용 재사용 PylonImage
 
 # 설정 상태 (web과 동일한 구조)
 app_state = {
@@ -69,13 +90,23 @@ def load_settings():
         print(f"⚠️ 설정 파일 로드 실패: {e}")
     return False
 
+_last_saved_json = None  # 마지막으로 파일에 쓴 내용 (변경 없으면 쓰기 생략)
+
 def save_settings():
     """설정을 파일에 저장 (web과 동일한 방식)"""
+    global _last_saved_json
     try:
+        data = json.dumps(app_state, indent=2, ensure_ascii=False)
+        if data == _last_saved_json:
+            return True
         # 디렉토리가 없으면 생성
         os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(app_state, f, indent=2, ensure_ascii=False)
+        # 임시 파일에 쓴 뒤 교체 (저장 중 종료되어도 설정 파일이 깨지지 않음)
+        tmp_path = SETTINGS_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, SETTINGS_FILE)
+        _last_saved_json = data
         print(f"✅ 설정 파일 저장 완료: {SETTINGS_FILE}")
         return True
     except Exception as e:
@@ -83,138 +114,145 @@ def save_settings():
         return False
 
 # =================== 카메라 초기화 ===================
+def setup_camera(cam_id, cam):
+    cam.SetCameraContext(cam_id)  # grabResult.GetCameraContext()로 카메라 번호 식별
+    # 카메라에서 BGR8로 바로 출력 (소프트웨어 디베이어 생략), 미지원 모델은 converter 사용
+    try:
+        cam.PixelFormat.SetValue("BGR8")
+        bgr_direct_cams.add(cam_id)
+    except Exception:
+        print(f"ℹ️ [CAM {cam_id}] BGR8 미지원, 변환기 사용: {cam.PixelFormat.GetValue()}")
+    # 그랩 버퍼와 출력 큐를 최신 1장으로 제한 (LatestImageOnly와 함께 오래된 프레임이 쌓이지 않도록)
+    try:
+        cam.MaxNumBuffer.SetValue(1)
+        cam.OutputQueueSize.SetValue(1)
+    except Exception as e:
+        print(f"⚠️ [CAM {cam_id}] 버퍼 설정 실패: {e}")
+
 def init_cameras():
-    global cameras, camera_map, converter, cameras_available
+    global cameras, camera_map, converter, cameras_available, bgr_direct_cams
     try:
-        tl_factory = pylon.TlFactory.GetInstance()
-        devices = tl_factory.EnumerateDevices()
-        if len(devices) == 0:
-            print("⚠️ Basler 카메라가 발견되지 않았습니다.")
+        bgr_direct_cams = set()
+        if not camera_system.open(setup_camera):
             cameras_available = False
             return
         
-        cameras = pylon.InstantCameraArray(len(devices))
-        camera_map = {}
-        
-        for i, cam in enumerate(cameras):
-            cam.Attach(tl_factory.CreateDevice(devices[i]))
-            cam.Open()
-            cam.Width.SetValue(cam.Width.Max)
-            cam.Height.SetValue(cam.Height.Max)
-            camera_map[i + 1] = cam
-        
-        converter = pylon.ImageFormatConverter()
-        converter.OutputPixelFormat = pylon.PixelType_BGR8packed
-        converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+        cameras = camera_system.cameras
+        camera_map = camera_system.camera_map
+        converter = make_converter()
         
-        cameras.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+        camera_system.start_grabbing()
         cameras_available = True
         print("✅ 카메라 초기화 완료")
     except Exception as e:
         print(f"⚠️ 카메라 초기화 실패: {e}")
+        camera_system.reset()
         cameras_available = False
         cameras = None
         camera_map = {}
         converter = None
+        bgr_direct_cams = set()
 
-# =================== 조명 초기화 ===================
+# =================== 조명 제어 ===================
 def init_lights():
-    global light_clients
-    print("\n=== 조명 컨트롤러 연결 시작 ===")
-    for port in LIGHT_PORTS:
-        try:
-            client = ModbusSerialClient(port=port, baudrate=BAUDRATE, parity='N', stopbits=1, bytesize=8, timeout=0.1)
-            if client.connect():
-                light_clients[port] = client
-                print(f"✅ [{port}] 조명 연결 성공")
-            else:
-                print(f"❌ [{port}] 조명 연결 실패")
-        except Exception as e:
-            print(f"⚠️ [{port}] 오류: {e}")
-    print("==============================\n")
+    light_system.connect()
 
-# =================== 조명 제어 ===================
 def send_light_packet(val):
-    if val < 0:
-        val = 0
-    if val > 255:
-        val = 255
-    app_state["light_value"] = val
-    val_bytes = f"{val:03d}".encode('ascii')
-    packet = b'\x02' + b'A' + (val_bytes + b',') * 3 + val_bytes + b'\x03'
-    for port, client in light_clients.items():
-        if client and client.connected:
-            try:
-                client.socket.write(packet)
-            except:
-                pass
+    # 모든 조명 포트에 동시에 쓰고 끝날 때까지 대기 (값은 0~255로 제한)
+    app_state["light_value"] = light_system.send(val)
 
 # =================== 이미지 저장 ===================
-def save_snapshot_internal(light_val):
+def encode_and_write(filepath, img):
+    """PNG 인코딩 후 디스크 쓰기는 writer 스레드에 넘기고 쓰기 작업 future 반환"""
+    buf = snapshot_saver.encode(filepath, img)
+    if buf is None:
+        raise IOError(f"PNG 인코딩 실패: {filepath}")
+    return write_pool.submit(snapshot_saver.write, filepath, buf)
+
+def submit_snapshot(light_val):
+    """현재 프레임의 저장 작업을 스레드 풀에 제출하고 {future: filepath} 반환 (완료를 기다리지 않음)"""
     if not cameras_available:
-        return 0
-    
-    base_path = app_state["save_path"]
-    product = app_state["product"]
-    cond1 = app_state["condition"]
-    cond2 = f"Light_{light_val:03d}"
-    shot_no = app_state["shot_no"]
-    mode = app_state["save_mode"]
-    
-    if not product or not cond1:
-        return 0
-    
-    path_std = os.path.join(base_path, product, cond1, cond2)
-    path_cam3 = os.path.join(base_path, "cam3", product, cond1, cond2)
-    
-    if mode in [1, 2]:
-        os.makedirs(path_std, exist_ok=True)
-    if mode in [2, 3]:
-        os.makedirs(path_cam3, exist_ok=True)
+        return {}
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    jobs = snapshot_saver.plan(latest_frames.get, app_state["save_path"], app_state["product"],
+                               app_state["condition"], light_val, app_state["shot_no"],
+                               app_state["save_mode"], timestamp)
     
-    images_to_save = {}
-    with frame_lock:
-        for cam_id in TARGET_CAMS:
-            if cam_id in latest_frames:
-                images_to_save[cam_id] = latest_frames[cam_id].copy()
-    
+    # 카메라별 PNG 인코딩을 스레드 풀에서 동시에 수행 (cv2.imencode는 GIL을 해제함)
+    return {save_pool.submit(encode_and_write, filepath, img): filepath for filepath, img in jobs}
+
+def wait_snapshot(futures):
+    """submit_snapshot으로 제출한 저장 작업이 끝날 때까지 기다리고 저장된 개수 반환"""
     saved_count = 0
-    for cam_id, img in images_to_save.items():
-        if mode == 1 and cam_id == 3:
-            continue
-        elif mode == 3 and cam_id != 3:
-            continue
-        
-        filename = f"{product}_{cond1}_{cond2}_{shot_no:03d}_Cam{cam_id}_{timestamp}.png"
-        filepath = os.path.join(path_cam3 if cam_id == 3 else path_std, filename)
-        
+    for future, filepath in futures.items():
         try:
-            cv2.imwrite(filepath, img)
+            future.result().result()  # 인코딩 완료 -> 디스크 쓰기 완료
             print(f"saved: {filepath}")
             saved_count += 1
         except:
             pass
     return saved_count
 
+def save_snapshot_internal(light_val):
+    return wait_snapshot(submit_snapshot(light_val))
+
 # =================== 카메라 스레드 ===================
+def drain_to_latest(idx, cam, grabResult):
+    """받은 grabResult 이후 큐에 남은 프레임을 모두 비우고 가장 최신 성공 프레임만 반환"""
+    latest = None
+    while grabResult:
+        if grabResult.GrabSucceeded():
+            if latest:
+                latest.Release()
+                dropped_frames[idx] = dropped_frames.get(idx, 0) + 1
+            latest = grabResult
+        else:
+            grabResult.Release()
+        grabResult = cam.RetrieveResult(0, pylon.TimeoutHandling_Return)
+    return latest
+
+def publish_frame(idx, grabResult):
+    """grabResult를 새 BGR 배열로 만들어 latest_frames에 게시 (락 없이 참조 교체)"""
+    if idx in bgr_direct_cams:
+        # 이미 BGR8이므로 변환 없이 새 배열로 한 번만 복사
+        frame = grabResult.GetArray()
+    else:
+        # 변환 결과는 재사용 PylonImage에 받고, 게시용 배열로 한 번만 복사
+        image = converted_images.get(idx)
+        if image is None:
+            image = pylon.PylonImage()
+            converted_images[idx] = image
+        converter.Convert(image, grabResult)
+        frame = image.GetArray()
+    latest_frames[idx] = frame
+    frame_seq[idx] = frame_seq.get(idx, 0) + 1
+    
+    # 미리보기 주기를 카메라 속도에 맞추기 위한 프레임 간격 평균
+    now = time.perf_counter()
+    last = frame_times.get(idx)
+    if last is not None:
+        interval_ms = (now - last) * 1000
+        ema = frame_interval_ema.get(idx)
+        frame_interval_ema[idx] = interval_ms if ema is None else ema + FRAME_EMA_ALPHA * (interval_ms - ema)
+    frame_times[idx] = now
+
 class CameraThread(QThread):
     def run(self):
         global running, latest_frames
         while running:
             try:
-                if cameras_available and cameras and camera_map:
-                    for idx, cam in camera_map.items():
-                        if cam.IsGrabbing():
-                            grabResult = cam.RetrieveResult(50, pylon.TimeoutHandling_Return)
-                            if grabResult and grabResult.GrabSucceeded():
-                                image = converter.Convert(grabResult)
-                                with frame_lock:
-                                    latest_frames[idx] = image.GetArray()
-                            if grabResult:
-                                grabResult.Release()
-                time.sleep(0.01)
+                if cameras_available and cameras and camera_map and cameras.IsGrabbing():
+                    # 어느 카메라든 프레임이 도착할 때까지 블로킹 대기 (sleep 폴링 없음)
+                    grabResult = cameras.RetrieveResult(100, pylon.TimeoutHandling_Return)
+                    if grabResult:
+                        idx = grabResult.GetCameraContext()
+                        grabResult = drain_to_latest(idx, camera_map[idx], grabResult)
+                        if grabResult:
+                            publish_frame(idx, grabResult)
+                            grabResult.Release()
+                else:
+                    time.sleep(0.1)  # 카메라가 없을 때는 대기만
             except Exception as e:
                 print(f"Camera Thread Error: {e}")
                 time.sleep(0.1)
@@ -223,6 +261,7 @@ class CameraThread(QThread):
 class ResizableCameraWidget(QFrame):
     """마우스 드래그로 크기 조절 가능한 카메라 위젯"""
     size_changed = Signal(int, int)  # width, height
+    label_resized = Signal(int)  # cam_id (레이아웃 변경 포함 실제 크기 변경 시)
     
     def __init__(self, cam_id, parent=None):
         super().__init__(parent)
@@ -300,6 +339,10 @@ class ResizableCameraWidget(QFrame):
             self.dragging = False
             self.setCursor(Qt.ArrowCursor)
     
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.label_resized.emit(self.cam_id)
+    
     def set_camera_size(self, width, height):
         """외부에서 크기 설정 (동기화용) - 신호를 emit하지 않음"""
         # 드래그 중이 아닐 때만 크기 변경 (무한 루프 방지)
@@ -319,6 +362,23 @@ class VisionSystemWindow(QMainWindow):
             # 설정 로드
             load_settings()
             
+            # 설정 저장 지연 타이머 (입력이 멈춘 뒤 한 번만 저장)
+            self._save_timer = QTimer(self)
+            self._save_timer.setSingleShot(True)
+            self._save_timer.timeout.connect(save_settings)
+            
+            # 프리뷰용 버퍼 (QImage가 버퍼를 복사 없이 참조하므로 유지 필요)
+            self._frames = {}  # 카메라별 마지막으로 가져온 프레임 참조
+            self._resized = {}  # 카메라별 리사이즈 결과 버퍼
+            self._qimages = {}  # 카메라별 리사이즈 버퍼를 참조하는 QImage
+            self._cam_geom = {}  # 카메라별 (너비, 높이, font_scale, thickness)
+            self._last_shown_seq = {}  # 카메라별 마지막으로 가져온 frame_seq
+            self._render_keys = {}  # 카메라별 마지막 렌더링 조건 (frame_seq, 너비, 높이, 저장 모드)
+            self._offline_cache = {}  # (cam_id, 너비, 높이, cameras_available) -> 검은 화면 QPixmap
+            self._black_buf = None  # 검은 화면 QPixmap 생성용 재사용 버퍼
+            self._text_cache = {}  # (텍스트, 크기, 색상, 두께) -> 텍스트 타일
+            self.update_camera_labels(app_state["save_mode"])  # 카메라별 (문구, 색상)
+            
             # 중앙 위젯
             central_widget = QWidget()
             self.setCentralWidget(central_widget)
@@ -346,8 +406,9 @@ class VisionSystemWindow(QMainWindow):
             
             # 프리뷰 업데이트 타이머
             self.preview_timer = QTimer()
+            self.preview_timer.setTimerType(Qt.PreciseTimer)
             self.preview_timer.timeout.connect(self.update_previews)
-            self.preview_timer.start(33)  # 약 30 FPS
+            self.preview_timer.start(PREVIEW_INTERVAL_MS)
             
             # 초기 조명 설정 적용
             try:
@@ -537,6 +598,7 @@ class VisionSystemWindow(QMainWindow):
             widget = ResizableCameraWidget(cam_id)
             widget.setMinimumSize(initial_width, initial_height)
             widget.size_changed.connect(self.on_camera_size_changed)
+            widget.label_resized.connect(self.invalidate_camera_geometry)
             
             row, col = positions[idx]
             grid_layout.addWidget(widget, row, col)
@@ -547,11 +609,28 @@ class VisionSystemWindow(QMainWindow):
         
         return panel
     
+    def invalidate_camera_geometry(self, cam_id):
+        """위젯 크기가 바뀌면 캐시된 미리보기 크기/글자 크기를 다시 계산하도록 함"""
+        self._cam_geom.pop(cam_id, None)
+    
+    def camera_geometry(self, cam_id):
+        """(너비, 높이, font_scale, thickness) - 크기가 바뀔 때만 다시 계산"""
+        geom = self._cam_geom.get(cam_id)
+        if geom is None:
+            label_size = self.camera_widgets[cam_id].label.size()
+            target_width = label_size.width()
+            target_height = label_size.height()
+            font_scale = max(0.5, min(2.0, target_width / 400))
+            thickness = max(1, int(2 * font_scale))
+            geom = (target_width, target_height, font_scale, thickness)
+            self._cam_geom[cam_id] = geom
+        return geom
+    
     def on_camera_size_changed(self, width, height):
         """하나의 카메라 크기가 변경되면 모든 카메라 크기 동기화"""
         app_state["camera_width"] = width
         app_state["camera_height"] = height
-        save_settings()
+        self.schedule_save_settings()
         
         # 크기 변경을 발생시킨 위젯 찾기
         sender_widget = self.sender()
@@ -563,65 +642,74 @@ class VisionSystemWindow(QMainWindow):
     
     def update_previews(self):
         """카메라 미리보기 업데이트"""
+        self.adapt_preview_interval()
         current_mode = app_state["save_mode"]
         
-        with frame_lock:
-            for cam_id in sorted(TARGET_CAMS):
-                if cam_id not in self.camera_widgets:
+        # 게시된 프레임은 변경되지 않으므로 락/복사 없이 새 프레임의 참조만 가져옴
+        has_frame = {}
+        for cam_id in sorted(TARGET_CAMS):
+            seq = frame_seq.get(cam_id, 0)
+            src = latest_frames.get(cam_id)
+            has_frame[cam_id] = src is not None
+            if src is None:
+                continue
+            if seq == self._last_shown_seq.get(cam_id):
+                continue  # 이전 틱 이후 새 프레임 없음 (마지막 프레임 유지)
+            self._frames[cam_id] = src
+            self._last_shown_seq[cam_id] = seq
+        
+        # 다시 그릴 카메라의 리사이즈를 한꺼번에 제출하고 (cv2.resize는 GIL 해제) 마지막에 모아서 표시
+        pending = []
+        for cam_id in sorted(TARGET_CAMS):
+            if cam_id not in self.camera_widgets:
+                continue
+                
+            label = self.camera_widgets[cam_id].label
+            target_width, target_height, font_scale, thickness = self.camera_geometry(cam_id)
+            
+            if has_frame[cam_id]:
+                # 프레임 / 라벨 크기 / 저장 모드가 모두 그대로면 다시 그릴 필요 없음
+                render_key = (self._last_shown_seq[cam_id], target_width, target_height, current_mode)
+                if render_key == self._render_keys.get(cam_id):
                     continue
-                    
-                widget = self.camera_widgets[cam_id]
-                label = widget.label
-                label_size = label.size()
+                self._render_keys[cam_id] = render_key
                 
-                if cam_id in latest_frames:
-                    raw_img = latest_frames[cam_id]
-                    h, w = raw_img.shape[:2]
-                    
-                    # 위젯 크기에 맞춰 스케일 조정
-                    target_width = label_size.width()
-                    target_height = label_size.height()
-                    scale_w = target_width / w
-                    scale_h = target_height / h
-                    scale = min(scale_w, scale_h)  # 비율 유지
-                    
-                    preview_img = cv2.resize(raw_img, (int(w * scale), int(h * scale)))
-                    
-                    will_save = True
-                    if current_mode == 1 and cam_id == 3:
-                        will_save = False
-                    if current_mode == 3 and cam_id != 3:
-                        will_save = False
-                    
-                    if will_save:
-                        if cam_id == 3:
-                            txt, color = "CAM 3 (ON)", (0, 255, 255)
-                        else:
-                            txt, color = f"CAM {cam_id} (ON)", (0, 255, 0)
+                raw_img = self._frames[cam_id]
+                h, w = raw_img.shape[:2]
+                
+                # 위젯 크기에 맞춰 스케일 조정
+                scale_w = target_width / w
+                scale_h = target_height / h
+                scale = min(scale_w, scale_h)  # 비율 유지
+                
+                # 카메라별로 재사용하는 리사이즈 버퍼에 바로 출력 (dst=)
+                # 라벨 크기에 맞춰 한 번에 축소하므로 QPixmap 재스케일은 필요 없음
+                preview_w, preview_h = int(w * scale), int(h * scale)
+                preview_img = self._resized.get(cam_id)
+                if preview_img is None or preview_img.shape[:2] != (preview_h, preview_w):
+                    preview_img = np.empty((preview_h, preview_w) + raw_img.shape[2:], dtype=np.uint8)
+                    self._resized[cam_id] = preview_img
+                    # 버퍼가 바뀔 때만 QImage를 새로 만듦 (BGR 그대로 사용, cvtColor 복사 없음)
+                    self._qimages[cam_id] = QImage(preview_img.data, preview_w, preview_h,
+                                                   preview_img.strides[0], QImage.Format_BGR888)
+                future = preview_pool.submit(cv2.resize, raw_img, (preview_w, preview_h),
+                                             dst=preview_img, interpolation=cv2.INTER_AREA)
+                
+                txt, color = self._cam_labels[cam_id]
+                pending.append((future, cam_id, label, preview_img, txt, color, font_scale, thickness))
+            else:
+                # 검은 화면 (크기/상태가 같으면 캐시된 QPixmap 재사용)
+                key = (cam_id, target_width, target_height, cameras_available)
+                pixmap = self._offline_cache.get(key)
+                if pixmap is None:
+                    # 검은 화면 버퍼는 크기가 같으면 재사용 (QPixmap.fromImage가 내용을 복사함)
+                    black_img = self._black_buf
+                    if black_img is None or black_img.shape[:2] != (target_height, target_width):
+                        black_img = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+                        self._black_buf = black_img
                     else:
-                        txt, color = f"CAM {cam_id} (OFF)", (128, 128, 128)
+                        black_img[...] = 0
                     
-                    # 텍스트 크기를 위젯 크기에 맞게 조정
-                    font_scale = max(0.5, min(2.0, target_width / 400))
-                    thickness = max(1, int(2 * font_scale))
-                    cv2.putText(preview_img, txt, (20, int(50 * font_scale)), 
-                              cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
-                    
-                    # OpenCV 이미지를 QPixmap으로 변환
-                    rgb_image = cv2.cvtColor(preview_img, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_image.shape
-                    bytes_per_line = ch * w
-                    qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                    pixmap = QPixmap.fromImage(qt_image)
-                    label.setPixmap(pixmap.scaled(label_size, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-                else:
-                    # 검은 화면
-                    target_width = label_size.width()
-                    target_height = label_size.height()
-                    black_img = np.zeros((target_height, target_width, 3), dtype=np.uint8)
-                    
-                    font_scale = max(0.5, min(2.0, target_width / 400))
-                    thickness = max(1, int(2 * font_scale))
                     if not cameras_available:
                         cv2.putText(black_img, f"CAM {cam_id} (No Camera)", 
                                   (20, target_height // 2),
@@ -631,48 +719,121 @@ class VisionSystemWindow(QMainWindow):
                                   (50, target_height // 2),
                                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, (100, 100, 100), thickness)
                     
-                    rgb_image = cv2.cvtColor(black_img, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_image.shape
-                    bytes_per_line = ch * w
-                    qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
+                    h, w = black_img.shape[:2]
+                    qt_image = QImage(black_img.data, w, h, black_img.strides[0], QImage.Format_BGR888)
                     pixmap = QPixmap.fromImage(qt_image)
-                    label.setPixmap(pixmap)
+                    
+                    # 가장 오래된 항목부터 제거
+                    if len(self._offline_cache) >= OFFLINE_CACHE_SIZE:
+                        self._offline_cache.pop(next(iter(self._offline_cache)))
+                    self._offline_cache[key] = pixmap
+                label.setPixmap(pixmap)
+        
+        for future, cam_id, label, preview_img, txt, color, font_scale, thickness in pending:
+            future.result()
+            # 텍스트 크기는 위젯 크기에 맞게 조정된 값 사용
+            self.draw_text(preview_img, txt, (20, int(50 * font_scale)), font_scale, color, thickness)
+            
+            # QImage는 preview_img 버퍼를 그대로 참조하므로 QPixmap으로만 변환
+            label.setPixmap(QPixmap.fromImage(self._qimages[cam_id]))
+    
+    def update_camera_labels(self, mode):
+        """저장 모드가 바뀔 때만 카메라별 미리보기 문구/색상을 다시 계산"""
+        self._cam_labels = {}
+        for cam_id in TARGET_CAMS:
+            will_save = True
+            if mode == 1 and cam_id == 3:
+                will_save = False
+            if mode == 3 and cam_id != 3:
+                will_save = False
+            
+            if will_save:
+                if cam_id == 3:
+                    self._cam_labels[cam_id] = ("CAM 3 (ON)", (0, 255, 255))
+                else:
+                    self._cam_labels[cam_id] = (f"CAM {cam_id} (ON)", (0, 255, 0))
+            else:
+                self._cam_labels[cam_id] = (f"CAM {cam_id} (OFF)", (128, 128, 128))
+    
+    def adapt_preview_interval(self):
+        """가장 빠른 카메라의 프레임 간격보다 빠르게 그리지 않도록 타이머 주기 조정"""
+        if not frame_interval_ema:
+            return
+        fastest_ms = min(frame_interval_ema.values())
+        interval = int(min(PREVIEW_MAX_INTERVAL_MS, max(PREVIEW_MIN_INTERVAL_MS, 0.9 * fastest_ms)))
+        if interval != self.preview_timer.interval():
+            self.preview_timer.setInterval(interval)
+    
+    def text_tile(self, txt, font_scale, color, thickness):
+        """텍스트를 한 번만 래스터화해서 (BGR 타일, 잉크 마스크, 기준점 x, 기준점 y)로 캐시"""
+        key = (txt, font_scale, color, thickness)
+        tile = self._text_cache.get(key)
+        if tile is None:
+            (text_w, text_h), baseline = cv2.getTextSize(txt, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+            pad = thickness  # 획 두께만큼 여유
+            img = np.zeros((text_h + baseline + 2 * pad, text_w + 2 * pad, 3), dtype=np.uint8)
+            cv2.putText(img, txt, (pad, pad + text_h), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+            tile = (img, img.any(axis=2, keepdims=True), pad, pad + text_h)
+            
+            if len(self._text_cache) >= TEXT_CACHE_SIZE:
+                self._text_cache.pop(next(iter(self._text_cache)))
+            self._text_cache[key] = tile
+        return tile
+    
+    def draw_text(self, img, txt, org, font_scale, color, thickness):
+        """cv2.putText와 같은 위치에 캐시된 텍스트 타일을 복사"""
+        tile, mask, org_x, org_y = self.text_tile(txt, font_scale, color, thickness)
+        x0, y0 = org[0] - org_x, org[1] - org_y
+        # 이미지 밖으로 나가는 부분은 잘라냄
+        ix0, iy0 = max(x0, 0), max(y0, 0)
+        ix1 = min(x0 + tile.shape[1], img.shape[1])
+        iy1 = min(y0 + tile.shape[0], img.shape[0])
+        if ix0 >= ix1 or iy0 >= iy1:
+            return
+        tx0, ty0 = ix0 - x0, iy0 - y0
+        tx1, ty1 = ix1 - x0, iy1 - y0
+        np.copyto(img[iy0:iy1, ix0:ix1], tile[ty0:ty1, tx0:tx1], where=mask[ty0:ty1, tx0:tx1])
     
     # 설정 업데이트 함수들
+    def schedule_save_settings(self):
+        """연속 입력을 모아서 500ms 후 한 번만 저장"""
+        self._save_timer.start(500)
+    
     def update_product(self, text):
         app_state["product"] = text
-        save_settings()
+        self.schedule_save_settings()
     
     def update_condition(self, text):
         app_state["condition"] = text
-        save_settings()
+        self.schedule_save_settings()
     
     def update_shot_no(self, value):
         app_state["shot_no"] = value
-        save_settings()
+        self.schedule_save_settings()
     
     def update_light_value(self, value):
         app_state["light_value"] = value
     
     def update_save_path(self, text):
         app_state["save_path"] = text
-        save_settings()
+        self.schedule_save_settings()
     
     def update_save_mode(self, mode):
         app_state["save_mode"] = mode
-        save_settings()
+        self.update_camera_labels(mode)
+        self.schedule_save_settings()
     
     def update_sequence_start(self, value):
         app_state["sequence_start"] = value
-        save_settings()
+        self.schedule_save_settings()
     
     def update_sequence_end(self, value):
         app_state["sequence_end"] = value
-        save_settings()
+        self.schedule_save_settings()
     
     def update_sequence_step(self, value):
         app_state["sequence_step"] = value
-        save_settings()
+        self.schedule_save_settings()
     
     def select_save_path(self):
         path = QFileDialog.getExistingDirectory(self, "저장 위치 선택", app_state["save_path"])
@@ -749,18 +910,22 @@ class VisionSystemWindow(QMainWindow):
     def auto_sequence_logic(self, start_val, end_val, step_val):
         try:
             offset = 1 if step_val > 0 else -1
+            pending = {}  # 이전 스텝의 저장 작업 (다음 스텝 조명 안정화와 겹쳐서 진행)
             
             for val in range(start_val, end_val + offset, step_val):
                 # UI 업데이트는 메인 스레드에서
                 QTimer.singleShot(0, lambda v=val: self.auto_btn.setText(f"⏳ 촬영 중... (밝기: {v})"))
                 
+                # 저장할 프레임은 이미 확보했으므로 이전 스텝 인코딩 중에 조명을 바꿔도 됨
                 send_light_packet(val)
                 print(f"--- 조명 변경: {val} ---")
-                time.sleep(0.5)
+                time.sleep(LIGHT_SETTLE_SEC)
                 
-                save_snapshot_internal(val)
-                time.sleep(0.2)
+                wait_snapshot(pending)
+                pending = submit_snapshot(val)
+                time.sleep(CAPTURE_INTERVAL_SEC)
             
+            wait_snapshot(pending)
             app_state["shot_no"] += 1
             QTimer.singleShot(0, lambda: self.shot_no_spin.setValue(app_state["shot_no"]))
             QTimer.singleShot(0, lambda: (
@@ -786,15 +951,15 @@ class VisionSystemWindow(QMainWindow):
             self.camera_thread.quit()
             self.camera_thread.wait()
         
-        if cameras_available and cameras:
-            for cam in cameras:
-                if cam.IsGrabbing():
-                    cam.StopGrabbing()
-                cam.Close()
-        
-        for client in light_clients.values():
-            client.close()
+        if cameras_available:
+            camera_system.close()
+        light_system.close()
         
+        self.preview_timer.stop()
+        preview_pool.shutdown(wait=True)
+        save_pool.shutdown(wait=True)
+        write_pool.shutdown(wait=True)
+        self._save_timer.stop()
         save_settings()  # 종료 시 설정 저장
         event.accept()
 
@@ -805,9 +970,12 @@ def main():
     
     try:
         print("🔧 하드웨어 초기화 중...")
-        # 하드웨어 초기화
-        init_cameras()
-        init_lights()
+        # 하드웨어 초기화 (카메라/조명은 서로 독립적이므로 동시에 진행)
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            cam_future = ex.submit(init_cameras)
+            light_future = ex.submit(init_lights)
+            cam_future.result()
+            light_future.result()
         print("✅ 하드웨어 초기화 완료")
         
         print("🖥️  GUI 초기화 중...")
@@ -1,34 +1,51 @@
 import cv2
 import os
-import numpy as np
 from datetime import datetime
 import threading
 import time
-import json
+import queue
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import *
 from tkinter import messagebox
 from tkinter import filedialog
 from pypylon import pylon
-from pymodbus.client import ModbusSerialClient
+from vision_core import CameraSystem, LightSystem, SnapshotSaver, PreviewCompositor, FrameRing, FrameGrabber
 
 # =================== 설정 ===================
 TARGET_CAMS = [1, 2, 3, 4]   
+TARGET_CAMS_SORTED = tuple(sorted(TARGET_CAMS))  # 미리보기 표시 순서 (매 프레임 정렬하지 않도록 미리 계산)
 WINDOW_NAME = "Integrated Vision System"
 PREVIEW_SCALE_WIDTH = 400     
+PREVIEW_FPS = 30              # 미리보기 합성/표시 최대 주기
+USE_OPENCL = cv2.ocl.haveOpenCL()  # OpenCL 사용 가능 시 미리보기 축소를 GPU(T-API)로 처리, 아니면 CPU
+if USE_OPENCL:
+    cv2.ocl.setUseOpenCL(True)
+FRAME_RING_SIZE = 2           # 카메라별 프레임 링 버퍼 칸 수 (최신 + 직전 프레임)
+SAVE_QUEUE_SIZE = 8           # 디스크 저장 대기열 최대 길이 (촬영 1회 단위, 가득 차면 시퀀스가 잠시 대기)
+
+# 로그: 매 프레임/파일 단위 메시지는 logging으로 출력 (DEBUG는 기본 비활성 → 포맷/출력 비용 없음)
+logging.basicConfig(format="%(message)s")
+log = logging.getLogger("vision")
+log.setLevel(logging.INFO)
 
 # 조명 포트
 LIGHT_PORTS = ["COM2", "COM8", "COM9", "COM10"]
 BAUDRATE = 9600
 
 # 전역 변수
-latest_frames = {}
-frame_lock = threading.Lock()
+frame_rings = {}  # cam_id -> FrameRing (카메라 grab 쓰레드 1개가 쓰고, 미리보기/저장이 읽음)
+save_q = queue.Queue(maxsize=SAVE_QUEUE_SIZE)  # 촬영 1회분 [(filepath, img), ...] 저장 대기열, None = 종료 신호
+encode_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))  # 카메라별 PNG 동시 인코딩
+snapshot_saver = SnapshotSaver(TARGET_CAMS)
 running = True
-light_clients = {}
-cameras = None
+camera_system = CameraSystem()
+light_system = LightSystem(LIGHT_PORTS, BAUDRATE)
 camera_map = {}
-converter = None
+frame_handlers = []  # 등록된 이벤트 핸들러 참조 유지
 cameras_available = False
+sequence_progress = None  # 자동 시퀀스 진행 중인 밝기 값 (작업 쓰레드가 쓰고 ui_tick이 읽음, None = 진행 안 함)
+shown_progress = None     # 버튼에 마지막으로 표시한 진행 값
 
 # =================== GUI 초기화 ===================
 root = Tk()
@@ -37,51 +54,29 @@ root.geometry("520x950")
 
 # =================== 1. 하드웨어 초기화 ===================
 # (A) 카메라
-try:
-    tl_factory = pylon.TlFactory.GetInstance()
-    devices = tl_factory.EnumerateDevices()
-    if len(devices) == 0:
-        print("⚠️ Basler 카메라가 발견되지 않았습니다. 검은 화면으로 표시됩니다.")
-        cameras_available = False
-    else:
-        cameras = pylon.InstantCameraArray(len(devices))
-        camera_map = {} 
-
-        for i, cam in enumerate(cameras):
-            cam.Attach(tl_factory.CreateDevice(devices[i]))
-            cam.Open()
-            cam.Width.SetValue(cam.Width.Max)
-            cam.Height.SetValue(cam.Height.Max)
-            camera_map[i + 1] = cam 
-            
-        converter = pylon.ImageFormatConverter()
-        converter.OutputPixelFormat = pylon.PixelType_BGR8packed
-        converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+def setup_camera(cam_id, cam):
+    # pylon grab 쓰레드가 프레임 도착 시 FrameGrabber를 호출해 카메라별 링에 게시 (폴링 없음)
+    ring = frame_rings[cam_id] = FrameRing(FRAME_RING_SIZE)
+    handler = FrameGrabber(cam_id, ring)
+    cam.RegisterImageEventHandler(handler, pylon.RegistrationMode_Append, pylon.Cleanup_Delete)
+    frame_handlers.append(handler)
 
-        cameras.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+try:
+    if camera_system.open(setup_camera):
+        camera_system.start_grabbing(callback_loop=True)
+        camera_map = camera_system.camera_map
         cameras_available = True
         print("✅ 카메라 초기화 완료")
-
+    else:
+        print("ℹ️ 검은 화면으로 표시됩니다.")
 except Exception as e:
     print(f"⚠️ 카메라 초기화 실패: {e}. 검은 화면으로 표시됩니다.")
+    camera_system.reset()
     cameras_available = False
-    cameras = None
     camera_map = {}
-    converter = None
 
 # (B) 조명
-print("\n=== 조명 컨트롤러 연결 시작 ===")
-for port in LIGHT_PORTS:
-    try:
-        client = ModbusSerialClient(port=port, baudrate=BAUDRATE, parity='N', stopbits=1, bytesize=8, timeout=0.1)
-        if client.connect():
-            light_clients[port] = client
-            print(f"✅ [{port}] 조명 연결 성공")
-        else:
-            print(f"❌ [{port}] 조명 연결 실패")
-    except Exception as e:
-        print(f"⚠️ [{port}] 오류: {e}")
-print("==============================\n")
+light_system.connect()
 
 
 # =================== UI 요소 구성 ===================
@@ -109,15 +104,9 @@ Label(root, text="[ 수동 조명 제어 ]", font=("Arial", 12, "bold"), fg="blu
 light_val_str = StringVar(value="100") 
 
 def send_light_packet(val):
-    if val < 0: val = 0
-    if val > 255: val = 255
+    # 모든 조명 포트에 동시에 쓰고 끝날 때까지 대기 (값은 0~255로 제한)
+    val = light_system.send(val)
     light_val_str.set(str(val))
-    val_bytes = f"{val:03d}".encode('ascii')
-    packet = b'\x02' + b'A' + (val_bytes + b',') * 3 + val_bytes + b'\x03'
-    for port, client in light_clients.items():
-        if client and client.connected:
-            try: client.socket.write(packet)
-            except: pass
 
 def apply_light_setting(event=None):
     try:
@@ -181,48 +170,51 @@ Entry(seq_frame, textvariable=seq_step_var, width=5, justify="center").pack(side
 
 # =================== 로직 함수들 ===================
 
-def save_snapshot_internal(light_val):
+def latest_frame(cam_id):
+    ring = frame_rings.get(cam_id)
+    return ring.latest() if ring else None
+
+def read_save_settings():
+    """저장 관련 Tk 변수를 한 번에 읽음 (메인 쓰레드에서 호출, 시퀀스 동안 재사용)"""
+    return (save_path_var.get().strip(), name_var.get().strip(), cond_var.get().strip(),
+            shot_no_var.get(), save_mode_var.get())
+
+def save_snapshot_internal(light_val, base_path, product, cond1, shot_no, mode):
     if not cameras_available:
         messagebox.showwarning("경고", "카메라가 연결되지 않았습니다. 이미지를 저장할 수 없습니다.")
         return 0
         
-    base_path = save_path_var.get().strip()
-    product = name_var.get().strip()
-    cond1 = cond_var.get().strip()
-    cond2 = f"Light_{light_val:03d}"
-    shot_no = shot_no_var.get()
-    mode = save_mode_var.get()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 링의 배열은 게시 후 변경되지 않으므로 복사 없이 참조만 가져와 writer에 넘김
+    # (생산자는 매 프레임 새 배열을 게시하므로 writer가 가진 배열을 덮어쓰지 않음)
+    batch = snapshot_saver.plan(latest_frame, base_path, product, cond1, light_val, shot_no, mode, timestamp)
 
-    if not product or not cond1: return 0
+    # PNG 인코딩/디스크 쓰기는 writer 쓰레드에서 촬영 1회분씩 처리 (대기열이 가득 차면 빈 자리가 날 때까지 대기)
+    if batch:
+        save_q.put(batch)
+    return len(batch)
 
-    path_std = os.path.join(base_path, product, cond1, cond2)
-    path_cam3 = os.path.join(base_path, "cam3", product, cond1, cond2)
-    
-    if mode in [1, 2]: os.makedirs(path_std, exist_ok=True)
-    if mode in [2, 3]: os.makedirs(path_cam3, exist_ok=True)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    images_to_save = {}
-    with frame_lock:
-        for cam_id in TARGET_CAMS:
-            if cam_id in latest_frames:
-                images_to_save[cam_id] = latest_frames[cam_id].copy()
-
-    saved_count = 0
-    for cam_id, img in images_to_save.items():
-        if mode == 1 and cam_id == 3: continue 
-        elif mode == 3 and cam_id != 3: continue
-
-        filename = f"{product}_{cond1}_{cond2}_{shot_no:03d}_Cam{cam_id}_{timestamp}.png"
-        filepath = os.path.join(path_cam3 if cam_id == 3 else path_std, filename)
-        
-        try:
-            cv2.imwrite(filepath, img)
-            print(f"saved: {filepath}")
-            saved_count += 1
-        except: pass
-    return saved_count
+# =================== 저장 writer 쓰레드 ===================
+def save_writer():
+    while True:
+        batch = save_q.get()
+        if batch is None:
+            break
+        # 촬영 1회분을 카메라별로 동시에 인코딩한 뒤 (cv2.imencode는 GIL을 해제함) 연속으로 기록
+        filepaths = [filepath for filepath, _ in batch]
+        encoded = list(encode_pool.map(snapshot_saver.encode, filepaths, [img for _, img in batch]))
+        # 원본 프레임은 인코딩이 끝나면 더 필요 없으므로 디스크 쓰기 전에 참조를 놓아 메모리를 바로 반환
+        del batch
+        for filepath, buf in zip(filepaths, encoded):
+            if buf is None:
+                log.warning("⚠️ 인코딩 실패: %s", filepath)
+                continue
+            try:
+                snapshot_saver.write(filepath, buf)
+                log.debug("saved: %s", filepath)
+            except Exception as e:
+                log.warning("⚠️ 저장 실패 (%s): %s", filepath, e)
 
 
 # =================== [수정됨] 자동 시퀀스 로직 ===================
@@ -252,14 +244,17 @@ def run_auto_sequence():
             messagebox.showerror("Error", "스텝이 음수(마이너스)일 때는 [Start >= End]여야 합니다.")
             restore_buttons()
             return
-            
-        threading.Thread(target=auto_sequence_logic, args=(start_val, end_val, step_val), daemon=True).start()
+
+        # 저장 설정은 시퀀스 시작 시 한 번만 읽어 모든 스텝에서 재사용
+        settings = read_save_settings()
+        threading.Thread(target=auto_sequence_logic, args=(start_val, end_val, step_val, settings), daemon=True).start()
         
-    except ValueError:
+    except (ValueError, TclError):
         messagebox.showerror("Error", "숫자만 입력해주세요.")
         restore_buttons()
 
-def auto_sequence_logic(start_val, end_val, step_val):
+def auto_sequence_logic(start_val, end_val, step_val, settings):
+    global sequence_progress
     try:
         # [수정됨] range의 끝값 처리 (양수/음수 스텝 모두 포함되도록)
         # 스텝이 양수면 end + 1, 음수면 end - 1 까지 루프를 돌림
@@ -267,16 +262,16 @@ def auto_sequence_logic(start_val, end_val, step_val):
         
         for val in range(start_val, end_val + offset, step_val):
             
-            # UI 업데이트
-            root.after(0, lambda v=val: btn_auto.config(text=f"⏳ 촬영 중... (밝기: {v})"))
+            # 진행 상태만 기록 (버튼 갱신은 ui_tick이 메인 쓰레드에서 처리)
+            sequence_progress = val
             
             # 조명 변경
             send_light_packet(val)
-            print(f"--- 조명 변경: {val} ---")
+            log.info("--- 조명 변경: %s ---", val)
             time.sleep(0.5) 
             
             # 촬영
-            save_snapshot_internal(val)
+            save_snapshot_internal(val, *settings)
             time.sleep(0.2)
 
         root.after(0, sequence_finished)
@@ -285,6 +280,15 @@ def auto_sequence_logic(start_val, end_val, step_val):
         print(f"Auto Sequence Error: {e}")
         root.after(0, restore_buttons)
 
+def ui_tick():
+    # 자동 시퀀스 진행 상태가 바뀌었을 때만 버튼 텍스트 갱신 (100ms 주기)
+    global shown_progress
+    progress = sequence_progress
+    if progress is not None and progress != shown_progress:
+        btn_auto.config(text=f"⏳ 촬영 중... (밝기: {progress})")
+    shown_progress = progress
+    root.after(100, ui_tick)
+
 def sequence_finished():
     shot_no_var.set(shot_no_var.get() + 1)
     restore_buttons()
@@ -294,12 +298,18 @@ def sequence_finished():
 
 def run_single_capture():
     btn_single.config(state="disabled", text="💾 저장 중...", bg="gray")
-    threading.Thread(target=single_capture_logic, daemon=True).start()
-
-def single_capture_logic():
     try:
+        # Tk 변수는 메인 쓰레드에서 읽어 작업 쓰레드로 전달
         current_light = int(light_val_str.get())
-        count = save_snapshot_internal(current_light)
+        settings = read_save_settings()
+    except (ValueError, TclError):
+        restore_buttons()
+        return
+    threading.Thread(target=single_capture_logic, args=(current_light, settings), daemon=True).start()
+
+def single_capture_logic(current_light, settings):
+    try:
+        count = save_snapshot_internal(current_light, *settings)
         if count > 0:
             root.after(0, lambda: shot_no_var.set(shot_no_var.get() + 1))
             root.after(0, lambda: btn_single.config(text="✅ 저장 완료", bg="#4CAF50"))
@@ -310,6 +320,8 @@ def single_capture_logic():
         root.after(0, restore_buttons)
 
 def restore_buttons():
+    global sequence_progress
+    sequence_progress = None
     btn_single.config(state="normal", text="📸 현재 설정으로 1회 촬영", bg="#E91E63")
     btn_auto.config(state="normal", text="🔄 자동 시퀀스 시작 (범위 적용)", bg="#2196F3")
 
@@ -330,80 +342,86 @@ def preview_thread():
     cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
     cv2.resizeWindow(WINDOW_NAME, 1600, 300)
 
+    # 미리보기 높이는 첫 카메라의 해상도 비율로 한 번만 계산 (카메라가 없으면 300)
+    preview_h = 300
+    if camera_map:
+        first_cam = camera_map[min(camera_map)]
+        preview_h = int(first_cam.Height.GetValue() * PREVIEW_SCALE_WIDTH / first_cam.Width.GetValue())
+
+    # 전체 미리보기 캔버스를 한 번만 할당하고, 카메라별 슬라이스에 직접 resize/putText (hconcat 없음)
+    compositor = PreviewCompositor(TARGET_CAMS_SORTED, PREVIEW_SCALE_WIDTH, preview_h, use_opencl=USE_OPENCL)
+    # (cam_id, 링 버퍼) 묶음을 한 번만 만들어 루프에서 dict 조회 없이 순회
+    # (링 버퍼는 카메라 초기화 때 모두 생성되므로 이후 바뀌지 않음)
+    camera_items = tuple((cam_id, frame_rings.get(cam_id)) for cam_id in TARGET_CAMS_SORTED)
+
+    frame_budget = 1.0 / PREVIEW_FPS
+
     while running:
         try:
-            # 카메라가 있을 때만 프레임 가져오기
-            if cameras_available and cameras and camera_map:
-                for idx, cam in camera_map.items():
-                    if cam.IsGrabbing():
-                        grabResult = cam.RetrieveResult(50, pylon.TimeoutHandling_Return)
-                        if grabResult and grabResult.GrabSucceeded():
-                            image = converter.Convert(grabResult)
-                            with frame_lock:
-                                latest_frames[idx] = image.GetArray()
-                        if grabResult:
-                            grabResult.Release()
-
-            display_images = []
+            loop_start = time.perf_counter()
+            # 프레임 수신은 FrameGrabber 콜백이 담당하므로 여기서는 합성/표시만 수행
             current_mode = save_mode_var.get() 
 
-            with frame_lock:
-                for cam_id in sorted(TARGET_CAMS):
-                    if cam_id in latest_frames:
-                        # 실제 프레임이 있는 경우
-                        raw_img = latest_frames[cam_id]
-                        h, w = raw_img.shape[:2]
-                        scale = PREVIEW_SCALE_WIDTH / w
-                        preview_img = cv2.resize(raw_img, (int(w * scale), int(h * scale)))
-                        
-                        will_save = True
-                        if current_mode == 1 and cam_id == 3: will_save = False 
-                        if current_mode == 3 and cam_id != 3: will_save = False 
-
-                        if will_save:
-                            if cam_id == 3: txt, color = "CAM 3 (ON)", (0, 255, 255) 
-                            else: txt, color = f"CAM {cam_id} (ON)", (0, 255, 0)
-                        else:
-                            txt, color = f"CAM {cam_id} (OFF)", (128, 128, 128)
-
-                        cv2.putText(preview_img, txt, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, color, 2)
-                        display_images.append(preview_img)
+            for cam_id, ring in camera_items:
+                seq = ring.head if ring else 0
+                if seq:
+                    # 새 프레임이 없고 저장 모드도 그대로면 이전에 그린 슬라이스 유지
+                    key = (seq, current_mode)
+                    if not compositor.needs_redraw(cam_id, key):
+                        continue
+                    raw_img = ring.buf[(seq - 1) & ring.mask]  # 표시용 resize는 원본을 수정하지 않으므로 참조만 사용
+
+                    # 실제 프레임이 있는 경우
+                    will_save = True
+                    if current_mode == 1 and cam_id == 3: will_save = False 
+                    if current_mode == 3 and cam_id != 3: will_save = False 
+
+                    if will_save:
+                        if cam_id == 3: txt, color = "CAM 3 (ON)", (0, 255, 255) 
+                        else: txt, color = f"CAM {cam_id} (ON)", (0, 255, 0)
                     else:
-                        # 카메라가 없거나 프레임이 없는 경우 검은 화면 표시
-                        black_img = np.zeros((300, PREVIEW_SCALE_WIDTH, 3), dtype=np.uint8)
-                        if not cameras_available:
-                            cv2.putText(black_img, f"CAM {cam_id} (No Camera)", (20, 150), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2)
-                        else:
-                            cv2.putText(black_img, f"CAM {cam_id} Off", (50, 150), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
-                        display_images.append(black_img)
-
-            if display_images:
-                combined_view = cv2.hconcat(display_images)
-                cv2.imshow(WINDOW_NAME, combined_view)
-
-            if cv2.waitKey(10) & 0xFF == 27:
+                        txt, color = f"CAM {cam_id} (OFF)", (128, 128, 128)
+
+                    compositor.draw_frame(cam_id, raw_img, txt, color, key)
+                elif compositor.needs_redraw(cam_id, "empty"):
+                    # 카메라가 없거나 프레임이 없는 경우 검은 화면 표시 (상태가 바뀔 때만 다시 그림)
+                    if not cameras_available:
+                        compositor.draw_placeholder(cam_id, f"CAM {cam_id} (No Camera)", 20, 0.8, "empty")
+                    else:
+                        compositor.draw_placeholder(cam_id, f"CAM {cam_id} Off", 50, 1, "empty")
+
+            cv2.imshow(WINDOW_NAME, compositor.canvas)
+
+            # 창 이벤트는 대기 없이 처리하고, 남은 시간만큼만 쉬어 약 PREVIEW_FPS로 표시
+            k = cv2.pollKey()
+            if k != -1 and (k & 0xFF) == 27:
                 running = False
                 break
+            elapsed = time.perf_counter() - loop_start
+            if elapsed < frame_budget:
+                time.sleep(frame_budget - elapsed)
         except Exception as e:
-            print(f"Preview Error: {e}")
+            log.warning("Preview Error: %s", e)
             break
     root.quit()
 
 # =================== 실행 ===================
 apply_light_setting()
+ui_tick()
+writer = threading.Thread(target=save_writer, daemon=True)
+writer.start()
 t = threading.Thread(target=preview_thread, daemon=True)
 t.start()
 root.mainloop()
 
 running = False
 t.join()
+# 대기 중인 이미지를 모두 기록한 뒤 writer 종료
+save_q.put(None)
+writer.join()
+encode_pool.shutdown()
 # 카메라가 있을 때만 정리 작업 수행
-if cameras_available and cameras:
-    for cam in cameras:
-        if cam.IsGrabbing(): cam.StopGrabbing()
-        cam.Close()
-for client in light_clients.values():
-    client.close()
+if cameras_available:
+    camera_system.close()
+light_system.close()
 cv2.destroyAllWindows()
@@ -10,6 +10,7 @@ from tkinter import messagebox
 from tkinter import filedialog
 from pypylon import pylon
 from pymodbus.client import ModbusSerialClient
+from vision_core import LIGHT_PACKETS, PNG_PARAMS  # 밝기 값별 미리 생성한 조명 패킷, 빠른 PNG 저장 옵션
 
 # =================== 설정 ===================
 TARGET_CAMS = [1, 2, 3, 4]   
@@ -104,8 +105,7 @@ def send_light_packet(val):
     if val < 0: val = 0
     if val > 255: val = 255
     light_val_str.set(str(val))
-    val_bytes = f"{val:03d}".encode('ascii')
-    packet = b'\x02' + b'A' + (val_bytes + b',') * 3 + val_bytes + b'\x03'
+    packet = LIGHT_PACKETS[val]
     for port, client in light_clients.items():
         if client and client.connected:
             try: client.socket.write(packet)
@@ -206,7 +206,7 @@ def save_snapshot_internal(light_val):
         filepath = os.path.join(path_cam3 if cam_id == 3 else path_std, filename)
         
         try:
-            cv2.imwrite(filepath, img)
+            cv2.imwrite(filepath, img, PNG_PARAMS)
             print(f"saved: {filepath}")
             saved_count += 1
         except: pass
@@ -5,36 +5,26 @@ import threading
 from tkinter import *
 
 from pypylon import pylon  # Basler 카메라 제어 라이브러리
+from vision_core import CameraSystem, make_converter, PNG_PARAMS  # 공통 카메라/저장 설정
 
 root = Tk()
 
 # =================== 카메라 초기화 ===================
-tl_factory = pylon.TlFactory.GetInstance()  # 카메라 팩토리 인스턴스 생성
-devices = tl_factory.EnumerateDevices()  # 연결된 카메라 목록 가져오기
-if len(devices) == 0:
+camera_system = CameraSystem()  # 카메라 열거/연결/최대 해상도 설정 (cam_id는 1부터)
+if not camera_system.open(lambda cam_id, cam: cam.PixelFormat.SetValue("BayerGR12")):  # 픽셀 포맷 설정
     raise IOError("No Basler cameras found.")  # 카메라 없으면 예외 발생
 
-cameras = pylon.InstantCameraArray(len(devices))  # 카메라 배열 생성
-camera_map = {}  # 카메라 인덱스와 객체 매핑
+cameras = camera_system.cameras  # 카메라 배열
+camera_map = camera_system.camera_map  # 카메라 인덱스와 객체 매핑
 
-for i, cam in enumerate(cameras):
-    device = tl_factory.CreateDevice(devices[i])  # 각 디바이스 객체 생성
-    cam.Attach(device)  # 카메라에 디바이스 연결
-    cam.Open()  # 카메라 오픈
-    cam.PixelFormat.SetValue("BayerGR12")  # 픽셀 포맷 설정
-    cam.Width.SetValue(cam.Width.Max)  # 최대 너비 설정
-    cam.Height.SetValue(cam.Height.Max)  # 최대 높이 설정
-    camera_map[i + 1] = cam  # 카메라 맵에 저장
+converter = make_converter()  # 이미지 포맷 변환기 생성 (BGR8 출력)
 
-converter = pylon.ImageFormatConverter()  # 이미지 포맷 변환기 생성
-converter.OutputPixelFormat = pylon.PixelType_BGR8packed  # 출력 포맷 설정
-converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned  # 비트 정렬 설정
-
-for cam in cameras:
-    cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)  # 최신 이미지만 가져오기 시작
+camera_system.start_grabbing()  # 최신 이미지만 가져오기 시작
 
 latest_frames = {}  # 각 카메라의 최신 프레임 저장
+latest_raw_frames = {}  # 각 카메라의 최신 원본 Bayer 프레임 저장 (SAVE_RAW일 때만)
 preview_max_width = 640  # 미리보기 최대 너비
+SAVE_RAW = False  # True: 디베이어링 없이 원본 BayerGR12(16bit 1채널)를 .tiff로 저장 (미리보기는 그대로 BGR 변환)
 
 
 
@@ -45,12 +35,19 @@ save_dir_var = StringVar(value="test")  # 저장 경로 변수
 def save_images(cam_ids):
     os.makedirs(save_dir_var.get(), exist_ok=True)  # 저장 폴더 생성
     product = name_var.get().strip()  # 제품명 가져오기
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")  # 촬영 시각 (카메라/촬영마다 다른 파일명)
 
+    frames = latest_raw_frames if SAVE_RAW else latest_frames
     for cam_id in cam_ids:
-        if cam_id in latest_frames:
-            filename = f"{name_var}.png"  # 파일명 생성
-            filepath = os.path.join(save_dir_var.get(), filename)  # 파일 경로 생성
-            cv2.imwrite(filepath, latest_frames[cam_id])  # 이미지 저장
+        if cam_id in frames:
+            if SAVE_RAW:
+                filename = f"{product}_Cam{cam_id}_{timestamp}.tiff"  # 원본 Bayer는 16bit 그대로 TIFF로 저장
+                filepath = os.path.join(save_dir_var.get(), filename)  # 파일 경로 생성
+                cv2.imwrite(filepath, frames[cam_id])  # 원본 이미지 저장
+            else:
+                filename = f"{product}_Cam{cam_id}_{timestamp}.png"  # 파일명 생성
+                filepath = os.path.join(save_dir_var.get(), filename)  # 파일 경로 생성
+                cv2.imwrite(filepath, frames[cam_id], PNG_PARAMS)  # 이미지 저장
             print(f"✅ Saved: {filepath}")  # 저장 완료 출력
         else:
             print(f"⚠️ Camera {cam_id} has no frame yet.")  # 프레임 없을 때 경고 출력
@@ -66,7 +63,9 @@ def update_previews():
             if cam.IsGrabbing():
                 grabResult = cam.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException)  # 이미지 가져오기
                 if grabResult.GrabSucceeded():
-                    image = converter.Convert(grabResult)  # 이미지 변환
+                    if SAVE_RAW:
+                        latest_raw_frames[idx] = grabResult.GetArray()  # 원본 Bayer 복사본 (Release 후에도 유효)
+                    image = converter.Convert(grabResult)  # 이미지 변환 (미리보기용)
                     img = image.GetArray()  # numpy 배열로 변환
                     latest_frames[idx] = img  # 최신 프레임 저장
 
@@ -79,9 +78,7 @@ def update_previews():
         if cv2.waitKey(1) & 0xFF == 27:
             break  # ESC 입력 시 종료
 
-    for cam in cameras:
-        cam.StopGrabbing()  # 이미지 가져오기 중지
-        cam.Close()  # 카메라 닫기
+    camera_system.close()  # 이미지 가져오기 중지 및 카메라 닫기
     cv2.destroyAllWindows()  # 모든 창 닫기
     root.quit()  # 프로그램 종료
 
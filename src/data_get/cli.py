@@ -9,6 +9,7 @@ Vision System CLI
 """
 import sys
 import os
+import runpy
 import subprocess
 import argparse
 from pathlib import Path
@@ -17,6 +18,14 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent.resolve()
 
 
+def run_script(script_path):
+    """GUI 스크립트를 독립된 __main__ 모듈로 실행 (__file__/__name__이 스크립트 기준으로 설정됨)"""
+    # 스크립트들이 공통 모듈(vision_core)을 import할 수 있도록 스크립트 폴더를 경로에 추가
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    runpy.run_path(str(script_path), run_name="__main__")
+
+
 def run_web():
     """웹 애플리케이션 실행"""
     print("🌐 웹 애플리케이션 시작 중...")
@@ -66,8 +75,7 @@ def run_re():
     
     os.chdir(BASE_DIR)
     try:
-        # Python 스크립트를 직접 실행
-        exec(open(script_path, encoding='utf-8').read())
+        run_script(script_path)
     except KeyboardInterrupt:
         print("\n🛑 애플리케이션 종료됨")
     except Exception as e:
@@ -89,8 +97,7 @@ def run_re_safe():
     
     os.chdir(BASE_DIR)
     try:
-        # Python 스크립트를 직접 실행
-        exec(open(script_path, encoding='utf-8').read())
+        run_script(script_path)
     except KeyboardInterrupt:
         print("\n🛑 애플리케이션 종료됨")
     except Exception as e:
@@ -112,8 +119,7 @@ def run_pyside6():
     
     os.chdir(BASE_DIR)
     try:
-        # Python 스크립트를 직접 실행
-        exec(open(script_path, encoding='utf-8').read())
+        run_script(script_path)
     except KeyboardInterrupt:
         print("\n🛑 애플리케이션 종료됨")
     except Exception as e:
@@ -4,10 +4,16 @@ import json
 import tkinter as tk
 from tkinter import ttk
 import binascii
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
 
-# pymodbus 라이브러리
-from pymodbus.client import ModbusSerialClient
-from pymodbus.exceptions import ModbusException
+# 조명 컨트롤러는 Modbus가 아닌 STX/ETX ASCII 프레임을 받으므로 pyserial로 직접 전송
+import serial
+
+from light_packets import LIGHT_PACKETS  # 밝기 값별 미리 생성한 조명 패킷 (vision_core와 공유)
+
+LIGHT_DEBUG = False  # True면 포트별 전송 패킷(HEX) 로그 출력
+SEND_DEBOUNCE_MS = 30  # 슬라이더 드래그 중 마지막 값만 전송하기 위한 대기 시간
 
 class LightControlApp:
     def __init__(self, root):
@@ -28,43 +34,46 @@ class LightControlApp:
         }
 
         self.clients = {}  
+        # 그룹 내 포트들에 같은 패킷을 동시에 쓰기 위한 스레드 풀
+        self._serial_pool = ThreadPoolExecutor(max_workers=len(self.ports["group_124"]) + len(self.ports["group_3"]))
         self.sliders = {}
+        self._last_sent = {"group_124": None, "group_3": None}  # 그룹별 마지막 전송 값 (같은 값 재전송 방지)
+        self._pending = {"group_124": None, "group_3": None}    # 그룹별 예약된 전송 after id
         self.is_loading = True 
 
         self._setup_ui()
-        self._init_modbus_and_sync()
+        self._init_serial_and_sync()
         self.is_loading = False
 
-    def _init_modbus_and_sync(self):
-        print("\n=== [Modbus 연결 및 동기화 시작] ===")
+    def _init_serial_and_sync(self):
+        print("\n=== [시리얼 연결 및 동기화 시작] ===")
         saved_data = self._load_settings()
 
         all_ports = self.ports["group_124"] + self.ports["group_3"]
         for port in all_ports:
             try:
-                # 메인 코드와 동일한 Modbus 설정
-                client = ModbusSerialClient(
+                # 메인 코드와 동일한 시리얼 설정
+                client = serial.Serial(
                     port=port,
                     baudrate=9600,
                     parity='N',
                     stopbits=1,
                     bytesize=8,
-                    timeout=0.2
+                    timeout=0.2,
+                    write_timeout=0.2
                 )
+                self.clients[port] = client
+                print(f"[{port}] 연결 성공")
+                
+                # 그룹에 맞는 저장된 값 적용
+                group_key = "group_124" if port in self.ports["group_124"] else "group_3"
+                val = saved_data.get(group_key, 240)
+                self.sliders[group_key].set(val)
                 
-                if client.connect():
-                    self.clients[port] = client
-                    print(f"[{port}] 연결 성공")
-                    
-                    # 그룹에 맞는 저장된 값 적용
-                    group_key = "group_124" if port in self.ports["group_124"] else "group_3"
-                    val = saved_data.get(group_key, 240)
-                    self.sliders[group_key].set(val)
-                    
-                    self.send_command(group_key, force=True)
-                else:
-                    self.clients[port] = None
-                    print(f"[{port}] 연결 실패")
+                self.send_command(group_key, force=True)
+            except serial.SerialException as e:
+                self.clients[port] = None
+                print(f"[{port}] 연결 실패: {e}")
             except Exception as e:
                 print(f"[{port}] 초기화 에러: {e}")
         print("====================================\n")
@@ -81,7 +90,7 @@ class LightControlApp:
 
         s1 = tk.Scale(frame1, from_=0, to=255, orient="horizontal", bg="#2d2d2d", fg="white",
                      troughcolor="#45a049", highlightthickness=0, 
-                     command=lambda v: self.send_command("group_124"))
+                     command=lambda v: self._schedule_send("group_124"))
         s1.pack(fill="x", expand=True)
         self.sliders["group_124"] = s1
 
@@ -92,32 +101,47 @@ class LightControlApp:
 
         s2 = tk.Scale(frame2, from_=0, to=255, orient="horizontal", bg="#2d2d2d", fg="white",
                      troughcolor="#7cfc00", highlightthickness=0, 
-                     command=lambda v: self.send_command("group_3"))
+                     command=lambda v: self._schedule_send("group_3"))
         s2.pack(fill="x", expand=True)
         self.sliders["group_3"] = s2
 
+    def _schedule_send(self, group_key):
+        """Scale 이벤트마다 바로 쓰지 않고 SEND_DEBOUNCE_MS 뒤로 미룸 (그 사이 새 이벤트가 오면 이전 예약 취소)"""
+        if self._pending[group_key] is not None:
+            self.root.after_cancel(self._pending[group_key])
+        self._pending[group_key] = self.root.after(SEND_DEBOUNCE_MS, self._send_pending, group_key)
+
+    def _send_pending(self, group_key):
+        self._pending[group_key] = None
+        self.send_command(group_key)
+
     def send_command(self, group_key, force=False):
         """ASCII 인코딩 및 전송 확인 로그 추가"""
         if self.is_loading and not force:
             return
             
         val = self.sliders[group_key].get()
-        # 숫자를 3자리 ASCII 바이트로 변환 (ex: 255 -> 0x32 0x35 0x35)
-        val_bytes = f"{val:03d}".encode('ascii') 
-        
-        # 패킷 조립: STX + 'A' + (데이터*4) + ETX
-        packet = b'\x02' + b'A' + (val_bytes + b',') * 3 + val_bytes + b'\x03'
+        # Scale은 드래그 중 같은 값으로도 계속 호출되므로 값이 그대로면 시리얼 쓰기 생략
+        if not force and self._last_sent[group_key] == val:
+            return
+        packet = LIGHT_PACKETS[val]
 
+        # 그룹 내 모든 포트에 동시에 쓰고 모두 끝날 때까지 대기
         target_ports = self.ports[group_key]
-        for port in target_ports:
-            client = self.clients.get(port)
-            if client and client.connected:
-                try:
-                    client.socket.write(packet)
-                    # --- [전송 확인 라인 추가] ---
-                    print(f"[{port}] 전송 확인 -> Value: {val}, Packet(HEX): {packet.hex().upper()}")
-                except Exception as e:
-                    print(f"[{port}] 전송 에러: {e}")
+        list(self._serial_pool.map(self._write_port, target_ports, repeat(packet)))
+        self._last_sent[group_key] = val
+
+    def _write_port(self, port, packet):
+        client = self.clients.get(port)
+        if client and client.is_open:
+            try:
+                client.write(packet)
+                client.flush()
+                # --- [전송 확인 라인 (LIGHT_DEBUG일 때만)] ---
+                if LIGHT_DEBUG:
+                    print(f"[{port}] 전송 확인 -> Value: {int(packet[2:5])}, Packet(HEX): {packet.hex().upper()}")
+            except Exception as e:
+                print(f"[{port}] 전송 에러: {e}")
 
     def _load_settings(self):
         if os.path.exists(self.save_filepath):
@@ -140,6 +164,12 @@ class LightControlApp:
         print("\n[System] 자원 해제 및 종료...")
         try:
             self._save_settings()
+            # 아직 예약만 된 전송은 바로 보내서 조명 상태와 저장 값을 일치시킴
+            for group_key, after_id in self._pending.items():
+                if after_id is not None:
+                    self.root.after_cancel(after_id)
+                    self._send_pending(group_key)
+            self._serial_pool.shutdown(wait=True)
             for client in self.clients.values():
                 if client:
                     client.close()
@@ -0,0 +1,7 @@
+"""
+조명 컨트롤러 패킷 테이블
+외부 의존성 없이 vision_core / light_control가 함께 import (조명 툴이 pypylon/cv2를 끌어오지 않도록)
+"""
+
+# 밝기 값(0~255)별 패킷 미리 생성: STX + 'A' + (3자리 ASCII 값,)*3 + 값 + ETX (ex: 255 -> 0x32 0x35 0x35)
+LIGHT_PACKETS = tuple(b'\x02' + b'A' + (b"%03d" % v + b',') * 3 + b"%03d" % v + b'\x03' for v in range(256))
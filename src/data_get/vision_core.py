@@ -0,0 +1,272 @@
+"""
+Vision System 공통 모듈
+GUI 스크립트(Imagecollect*.py)가 공유하는 카메라/조명/미리보기 합성/스냅샷 저장 로직
+"""
+import os
+import logging
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from pypylon import pylon
+import serial
+
+from light_packets import LIGHT_PACKETS  # 밝기 값별 미리 생성한 조명 패킷 (Imagecollect-re.py도 여기서 가져감)
+
+log = logging.getLogger("vision")
+
+PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]  # 빠른 저장 우선 (기본값 3보다 파일은 약간 큼)
+
+
+# =================== 카메라 ===================
+def make_converter():
+    """Bayer 등 카메라 출력 -> BGR8 변환기 생성"""
+    converter = pylon.ImageFormatConverter()
+    converter.OutputPixelFormat = pylon.PixelType_BGR8packed
+    converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+    return converter
+
+
+class FrameRing:
+    """카메라 1대용 단일 생산자 링 버퍼. 생산자만 head를 올리고, 소비자는 락 없이 최신 칸을 읽음"""
+    __slots__ = ("buf", "head", "mask")
+
+    def __init__(self, size=2):
+        # size는 2의 거듭제곱 (인덱스를 & mask로 계산)
+        self.buf = [None] * size
+        self.head = 0  # 지금까지 게시된 프레임 수 (0이면 아직 프레임 없음)
+        self.mask = size - 1
+
+    def push(self, arr):
+        # 칸을 먼저 채운 뒤 head를 올림 (각 대입은 GIL 하에서 원자적이므로 소비자는 항상 완성된 칸만 봄)
+        self.buf[self.head & self.mask] = arr
+        self.head += 1
+
+    def latest(self):
+        head = self.head
+        if head == 0:
+            return None
+        return self.buf[(head - 1) & self.mask]
+
+
+class FrameGrabber(pylon.ImageEventHandler):
+    """pylon grab 쓰레드에서 호출되어 변환된 프레임을 해당 카메라의 FrameRing에 게시"""
+    def __init__(self, cam_id, ring):
+        super().__init__()
+        self.cam_id = cam_id
+        self.ring = ring
+        # 카메라마다 전용 converter를 두어 grab 쓰레드끼리 공유 락 없이 각자 변환
+        self.converter = make_converter()
+
+    def OnImageGrabbed(self, camera, grabResult):
+        try:
+            if grabResult.GrabSucceeded():
+                image = self.converter.Convert(grabResult)
+                self.ring.push(image.GetArray())  # 새 배열 참조만 게시 (복사 없음)
+        except Exception as e:
+            log.warning("⚠️ CAM %s 프레임 처리 오류: %s", self.cam_id, e)
+
+
+class CameraSystem:
+    """연결된 Basler 카메라 열기/그랩 시작/정리 (cam_id는 1부터)"""
+    def __init__(self):
+        self.cameras = None
+        self.camera_map = {}
+        self.available = False
+
+    def open(self, setup=None):
+        """모든 카메라를 열고 최대 해상도로 설정. setup(cam_id, cam)으로 GUI별 추가 설정 (카메라가 없으면 False)"""
+        tl_factory = pylon.TlFactory.GetInstance()
+        devices = tl_factory.EnumerateDevices()
+        if len(devices) == 0:
+            print("⚠️ Basler 카메라가 발견되지 않았습니다.")
+            return False
+
+        self.cameras = pylon.InstantCameraArray(len(devices))
+        self.camera_map = {}
+        for i, cam in enumerate(self.cameras):
+            cam.Attach(tl_factory.CreateDevice(devices[i]))
+            cam.Open()
+            if setup:
+                setup(i + 1, cam)
+            cam.Width.SetValue(cam.Width.Max)
+            cam.Height.SetValue(cam.Height.Max)
+            self.camera_map[i + 1] = cam
+        self.available = True
+        return True
+
+    def start_grabbing(self, callback_loop=False):
+        """최신 프레임 우선으로 그랩 시작. callback_loop=True면 pylon 내부 쓰레드가 등록된 이벤트 핸들러 호출"""
+        if callback_loop:
+            for cam in self.cameras:
+                cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly, pylon.GrabLoop_ProvidedByInstantCamera)
+        else:
+            self.cameras.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+
+    def reset(self):
+        """초기화 실패 시 상태 초기화"""
+        self.cameras = None
+        self.camera_map = {}
+        self.available = False
+
+    def close(self):
+        if self.cameras:
+            for cam in self.cameras:
+                if cam.IsGrabbing():
+                    cam.StopGrabbing()
+                cam.Close()
+
+
+# =================== 조명 ===================
+def _write_packet(client, packet):
+    if client and client.is_open:
+        try:
+            client.write(packet)
+            client.flush()  # 송신 완료까지 대기
+        except:
+            pass
+
+
+class LightSystem:
+    """조명 컨트롤러(시리얼 포트) 연결 및 밝기 패킷 동시 전송 (Modbus가 아닌 STX/ETX ASCII 프레임)"""
+    def __init__(self, ports, baudrate=9600, timeout=0.1):
+        self.ports = ports
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.clients = {}
+        self.client_list = []  # 연결된 클라이언트 스냅샷 (연결 시에만 갱신, 전송 루프에서 사용)
+        self.pool = None       # 포트별 동시 전송용 스레드 풀
+
+    def connect_port(self, port):
+        try:
+            client = serial.Serial(port=port, baudrate=self.baudrate, parity='N', stopbits=1, bytesize=8,
+                                   timeout=self.timeout, write_timeout=self.timeout)
+            print(f"✅ [{port}] 조명 연결 성공")
+            return client
+        except serial.SerialException as e:
+            print(f"❌ [{port}] 조명 연결 실패: {e}")
+        except Exception as e:
+            print(f"⚠️ [{port}] 오류: {e}")
+        return None
+
+    def connect(self):
+        print("\n=== 조명 컨트롤러 연결 시작 ===")
+        # 포트마다 독립된 장치이므로 동시에 연결 (연결 시간 = 가장 느린 포트 기준)
+        if self.ports:
+            with ThreadPoolExecutor(max_workers=len(self.ports)) as ex:
+                for port, client in zip(self.ports, ex.map(self.connect_port, self.ports)):
+                    if client:
+                        self.clients[port] = client
+        self.client_list = list(self.clients.values())
+        if self.client_list:
+            self.pool = ThreadPoolExecutor(max_workers=len(self.client_list))
+        print("==============================\n")
+
+    def send(self, val):
+        """밝기 값을 0~255로 제한해 모든 포트에 동시에 쓰고, 쓰기가 끝나면 적용한 값 반환"""
+        if val < 0:
+            val = 0
+        if val > 255:
+            val = 255
+        if self.pool:
+            list(self.pool.map(_write_packet, self.client_list, repeat(LIGHT_PACKETS[val])))
+        return val
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=True)
+        for client in self.clients.values():
+            client.close()
+
+
+# =================== 스냅샷 저장 ===================
+class SnapshotSaver:
+    """촬영 1회분의 저장 경로 생성(저장 모드 반영)과 PNG 인코딩/쓰기"""
+    def __init__(self, cam_ids, png_params=PNG_PARAMS):
+        self.cam_ids = cam_ids
+        self.png_params = png_params
+        self._created_dirs = set()  # 이미 생성한 저장 폴더 (매 촬영마다 makedirs 반복 방지)
+
+    def ensure_dir(self, path):
+        if path not in self._created_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._created_dirs.add(path)
+
+    def plan(self, get_frame, base_path, product, cond1, light_val, shot_no, mode, timestamp):
+        """저장할 [(filepath, img), ...] 목록 생성. mode 1: Cam 3 제외, 2: 전체, 3: Cam 3만"""
+        if not product or not cond1:
+            return []
+
+        cond2 = f"Light_{light_val:03d}"
+        path_std = os.path.join(base_path, product, cond1, cond2)
+        path_cam3 = os.path.join(base_path, "cam3", product, cond1, cond2)
+        if mode in [1, 2]:
+            self.ensure_dir(path_std)
+        if mode in [2, 3]:
+            self.ensure_dir(path_cam3)
+
+        # 카메라 번호를 제외한 경로/파일명은 루프 밖에서 한 번만 생성
+        name_prefix = f"{product}_{cond1}_{cond2}_{shot_no:03d}_Cam"
+        prefix_std = f"{path_std}{os.sep}{name_prefix}"
+        prefix_cam3 = f"{path_cam3}{os.sep}{name_prefix}"
+        suffix = f"_{timestamp}.png"
+
+        # 게시된 프레임은 변경되지 않으므로 복사 없이 참조만 가져옴
+        jobs = []
+        for cam_id in self.cam_ids:
+            if mode == 1 and cam_id == 3:
+                continue
+            elif mode == 3 and cam_id != 3:
+                continue
+            img = get_frame(cam_id)
+            if img is not None:
+                jobs.append(((prefix_cam3 if cam_id == 3 else prefix_std) + str(cam_id) + suffix, img))
+        return jobs
+
+    def encode(self, filepath, img):
+        """PNG 인코딩 결과 버퍼 반환 (실패 시 None, cv2.imencode는 GIL을 해제함)"""
+        try:
+            ok, buf = cv2.imencode(".png", img, self.png_params)
+        except cv2.error:
+            return None
+        return buf if ok else None
+
+    @staticmethod
+    def write(filepath, buf):
+        # tofile은 한 번의 open/write로 기록하며 한글 경로에서도 동작함 (cv2.imwrite는 Windows 한글 경로 실패)
+        buf.tofile(filepath)
+
+
+# =================== 미리보기 합성 ===================
+class PreviewCompositor:
+    """카메라별 미리보기를 미리 할당한 하나의 가로 캔버스에 합성 (프레임마다 할당/hconcat 없음)"""
+    def __init__(self, cam_ids, tile_width, tile_height, use_opencl=False):
+        self.tile_size = (tile_width, tile_height)
+        self.canvas = np.zeros((tile_height, len(cam_ids) * tile_width, 3), dtype=np.uint8)
+        self.tiles = {cam_id: self.canvas[:, i * tile_width:(i + 1) * tile_width]
+                      for i, cam_id in enumerate(cam_ids)}
+        self.text_y = min(150, tile_height // 2)  # 빈 화면 안내 문구 높이
+        self.use_opencl = use_opencl
+        # 카메라별 마지막으로 그린 상태 (같은 상태면 슬라이스를 다시 그리지 않음)
+        self._tile_keys = {}
+
+    def needs_redraw(self, cam_id, key):
+        return self._tile_keys.get(cam_id) != key
+
+    def draw_frame(self, cam_id, img, text, color, key):
+        tile = self.tiles[cam_id]
+        if self.use_opencl:
+            # 원본을 UMat으로 올려 GPU에서 축소한 뒤 결과만 캔버스 슬라이스로 내려받음
+            tile[:] = cv2.resize(cv2.UMat(img), self.tile_size).get()
+        else:
+            cv2.resize(img, self.tile_size, dst=tile)
+        cv2.putText(tile, text, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, color, 2)
+        self._tile_keys[cam_id] = key
+
+    def draw_placeholder(self, cam_id, text, x, font_scale, key):
+        """카메라가 없거나 프레임이 없을 때 검은 화면 + 안내 문구"""
+        tile = self.tiles[cam_id]
+        tile[:] = 0
+        cv2.putText(tile, text, (x, self.text_y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (100, 100, 100), 2)
+        self._tile_keys[cam_id] = key
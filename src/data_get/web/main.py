@@ -1,6 +1,6 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import cv2
@@ -8,33 +8,75 @@ import os
 import numpy as np
 from datetime import datetime
 import threading
+import queue
 import time
-import json
-import base64
+import orjson
 import asyncio
+from functools import lru_cache
+from contextlib import contextmanager
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
 from pypylon import pylon
-from pymodbus.client import ModbusSerialClient
+import serial
 import uvicorn
 
+# libjpeg-turbo의 SIMD 인코더가 있으면 미리보기 JPEG 인코딩에 사용 (없으면 cv2.imencode)
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _tj = TurboJPEG()
+except Exception:
+    _tj = None
+
 # =================== 설정 ===================
 TARGET_CAMS = [1, 2, 3, 4]
 PREVIEW_SCALE_WIDTH = 400
+PREVIEW_BINNING = 1  # 미리보기 중 센서 비닝 배수 (1: 사용 안 함, 4 권장: 카메라에서 1/4 축소해 전송량 1/16). 저장 시에는 자동으로 해제
 LIGHT_PORTS = ["COM2", "COM8", "COM9", "COM10"]
 BAUDRATE = 9600
 DEFAULT_SAVE_PATH = "./captured_images"
 SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+JPEG_QUALITY = 85
+SAVE_JPEG_QUALITY = 95  # save_format이 "jpg"일 때 저장 품질
+SAVE_FORMATS = ("png", "jpg")
+PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]  # 빠른 저장 우선 (기본값 3보다 파일은 약간 큼)
+SAVE_QUEUE_SIZE = 16  # 대기 중인 저장 이미지 최대 수 (가득 차면 촬영 쪽이 잠시 대기)
+USE_OPENCL = cv2.ocl.haveOpenCL()  # OpenCL 장치가 있으면 미리보기 축소를 UMat(GPU)으로 수행
+if USE_OPENCL:
+    cv2.ocl.setUseOpenCL(True)
+LIGHT_SETTLE_S = 0.5  # 조명 변경 후 밝기가 안정될 때까지 대기 시간
+FULL_RES_IDLE_S = 5.0  # 마지막 저장 후 이 시간 동안 추가 촬영이 없으면 미리보기 비닝으로 복귀 (연속 수동 촬영 시 전환 반복 방지)
+GRAB_TIMEOUT_MS = 1000  # 그랩 쓰레드가 프레임을 기다리는 최대 시간 (종료/비닝 전환 시 반응 시간)
+FRAME_POOL_SIZE = 3  # 카메라별 상시 프레임 버퍼 수 (게시 중 1 + 미리보기 읽는 중 1 + 쓰는 중 1). 저장 대기로 모자라면 잠시 추가 후 해제
+
+# 밝기 값(0~255)별 패킷 미리 생성: STX + 'A' + (값,)*3 + 값 + ETX
+LIGHT_PACKETS = tuple(b'\x02' + b'A' + (b"%03d" % v + b',') * 3 + b"%03d" % v + b'\x03' for v in range(256))
 
 # =================== 전역 변수 ===================
-app = FastAPI(title="Vision System Web API")
-latest_frames = {}
-frame_lock = threading.Lock()
+app = FastAPI(title="Vision System Web API", default_response_class=ORJSONResponse)
+# 카메라별 FrameRing. 새 링이 생기면 dict를 통째로 새로 만들어 교체 (읽는 쪽은 참조 하나만 잡으면 일관된 스냅샷)
+frame_rings = {}
 running = True
 light_clients = {}
+light_client_list = []  # 연결된 클라이언트 스냅샷 (전송 루프에서 사용)
+light_pool = None       # 포트별 동시 전송용 스레드 풀
 cameras = None
 camera_map = {}
-converter = None
+converters = {}       # 카메라별 포맷 변환기 (그랩 쓰레드끼리 공유하지 않음)
+convert_targets = {}  # 카메라별 변환 결과 PylonImage (매 프레임 재사용)
 cameras_available = False
+binning_requests = {}            # 카메라별 대기 중인 비닝 전환 (배수, 완료 Event). grab_loop가 다음 그랩 전에 직접 적용
+rings_lock = threading.Lock()    # 여러 그랩 쓰레드의 frame_rings 교체를 직렬화 (읽기는 락 없음)
+full_res_lock = threading.Lock()
+full_res_users = 0               # full_resolution() 사용 중인 저장 작업 수 (중첩 호출용)
+full_res_timer = None            # 유휴 시간 후 비닝을 되돌리는 threading.Timer (새 저장이 시작되면 취소)
+binning_factor = 1               # 현재 카메라에 적용된 비닝 배수 (full_res_lock 안에서 변경)
 active_websockets: List[WebSocket] = []
+preview_event = asyncio.Event()  # 새 프리뷰 페이로드가 준비될 때마다 set() 후 바로 clear()
+latest_preview = None            # 모든 WebSocket이 공유하는 최신 프리뷰 (JSON 헤더 텍스트, JPEG 연결 bytes)
+preview_task = None
+preview_cache = {}  # 카메라별 (링, 프레임 번호, 저장 여부) -> 마지막으로 인코딩한 JPEG
+save_q = queue.Queue(maxsize=SAVE_QUEUE_SIZE)  # (cam_id, filepath, ring, slot, save_format) -> save_writer
+save_writer_thread = None
 
 # 설정 상태
 app_state = {
@@ -43,6 +85,7 @@ app_state = {
     "shot_no": 1,
     "save_path": DEFAULT_SAVE_PATH,
     "save_mode": 2,  # 1: Cam 3 제외, 2: 전체, 3: Cam 3만
+    "save_format": "png",  # "png": 무손실(압축 1), "jpg": 품질 95 (인코딩이 훨씬 빠름)
     "light_value": 100,
     "sequence_start": 30,
     "sequence_end": 120,
@@ -57,10 +100,13 @@ def load_settings():
     global app_state
     try:
         if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                loaded = json.load(f)
+            with open(SETTINGS_FILE, "rb") as f:
+                loaded = orjson.loads(f.read())
                 # 기존 설정과 병합 (기본값 유지)
                 for key, value in loaded.items():
+                    if key == "save_format" and value not in SAVE_FORMATS:
+                        print(f"⚠️ 알 수 없는 save_format 무시: {value}")
+                        continue
                     if key in app_state:
                         app_state[key] = value
                 print(f"✅ 설정 파일 로드 완료: {SETTINGS_FILE}")
@@ -70,8 +116,9 @@ def load_settings():
 def save_settings():
     """설정을 파일에 저장"""
     try:
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(app_state, f, indent=2, ensure_ascii=False)
+        # orjson은 UTF-8 bytes를 바로 반환 (한글도 이스케이프 없이 저장)
+        with open(SETTINGS_FILE, "wb") as f:
+            f.write(orjson.dumps(app_state, option=orjson.OPT_INDENT_2))
         print(f"✅ 설정 파일 저장 완료: {SETTINGS_FILE}")
         return True
     except Exception as e:
@@ -80,7 +127,7 @@ def save_settings():
 
 # =================== 카메라 초기화 ===================
 def init_cameras():
-    global cameras, camera_map, converter, cameras_available
+    global cameras, camera_map, converters, convert_targets, cameras_available, binning_factor
     try:
         tl_factory = pylon.TlFactory.GetInstance()
         devices = tl_factory.EnumerateDevices()
@@ -97,13 +144,17 @@ def init_cameras():
             cam.Open()
             cam.Width.SetValue(cam.Width.Max)
             cam.Height.SetValue(cam.Height.Max)
+            if PREVIEW_BINNING > 1:
+                set_camera_binning(cam, PREVIEW_BINNING)
             camera_map[i + 1] = cam
-        
-        converter = pylon.ImageFormatConverter()
-        converter.OutputPixelFormat = pylon.PixelType_BGR8packed
-        converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+            converter = pylon.ImageFormatConverter()
+            converter.OutputPixelFormat = pylon.PixelType_BGR8packed
+            converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+            converters[i + 1] = converter
+            convert_targets[i + 1] = pylon.PylonImage()
         
         cameras.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+        binning_factor = max(PREVIEW_BINNING, 1)
         cameras_available = True
         print("✅ 카메라 초기화 완료")
     except Exception as e:
@@ -111,111 +162,363 @@ def init_cameras():
         cameras_available = False
         cameras = None
         camera_map = {}
-        converter = None
+        converters = {}
+        convert_targets = {}
+
+# =================== 센서 비닝 ===================
+def set_camera_binning(cam, factor):
+    """가로/세로 비닝 배수 설정 (평균 모드) 후 바뀐 최대 해상도로 다시 맞춤. 그랩 중에는 호출 불가"""
+    try:
+        cam.BinningHorizontal.SetValue(factor)
+        cam.BinningVertical.SetValue(factor)
+    except Exception as e:
+        print(f"⚠️ 비닝 설정 실패: {e}")
+    if factor > 1:
+        try:
+            cam.BinningHorizontalMode.SetValue("Average")
+            cam.BinningVerticalMode.SetValue("Average")
+        except Exception:
+            pass  # 모드 설정이 없는 모델은 기본 모드(Sum) 사용
+    cam.Width.SetValue(cam.Width.Max)
+    cam.Height.SetValue(cam.Height.Max)
+
+def apply_binning(factor):
+    """모든 카메라에 비닝 전환을 요청하고 새 해상도의 첫 프레임이 들어올 때까지 대기 (full_res_lock 안에서 호출)"""
+    global binning_factor
+    binning_factor = factor
+    pending = []
+    for idx in camera_map:
+        done = threading.Event()
+        binning_requests[idx] = (factor, done)  # 실제 전환은 각 grab_loop가 RetrieveResult 사이에서 수행
+        pending.append(done)
+    # 그랩 쓰레드는 진행 중인 RetrieveResult(최대 GRAB_TIMEOUT_MS)가 끝나면 바로 요청을 처리
+    deadline = time.time() + GRAB_TIMEOUT_MS / 1000 + 2.0
+    for done in pending:
+        done.wait(max(0.0, deadline - time.time()))
+    while time.time() < deadline and any(idx not in frame_rings for idx in camera_map):
+        time.sleep(0.01)
+
+def switch_binning(idx, cam, factor, done):
+    """grab_loop 쓰레드 안에서 그랩을 멈추고 비닝 변경 후 재시작 (RetrieveResult와 겹치지 않으므로 락 불필요)"""
+    global frame_rings
+    try:
+        cam.StopGrabbing()
+        set_camera_binning(cam, factor)
+        cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+        with rings_lock:
+            # 이전 해상도 프레임은 버림
+            frame_rings = {k: v for k, v in frame_rings.items() if k != idx}
+    finally:
+        done.set()
+
+@contextmanager
+def full_resolution():
+    """저장하는 동안 비닝을 끄고 전체 해상도 프레임 사용. 끝나도 FULL_RES_IDLE_S 동안은 유지 (연속 촬영은 전환 없음)"""
+    global full_res_users, full_res_timer
+    if PREVIEW_BINNING <= 1 or not cameras_available:
+        yield
+        return
+    with full_res_lock:
+        full_res_users += 1
+        if full_res_timer is not None:
+            full_res_timer.cancel()
+            full_res_timer = None
+        if binning_factor != 1:
+            apply_binning(1)
+    try:
+        yield
+    finally:
+        with full_res_lock:
+            full_res_users -= 1
+            if full_res_users == 0:
+                full_res_timer = threading.Timer(FULL_RES_IDLE_S, restore_preview_binning)
+                full_res_timer.daemon = True
+                full_res_timer.start()
+
+def restore_preview_binning():
+    """유휴 타이머 만료 시 미리보기 비닝으로 복귀 (그 사이 새 저장이 시작됐으면 아무것도 하지 않음)"""
+    global full_res_timer
+    with full_res_lock:
+        if full_res_users > 0 or full_res_timer is None or threading.current_thread() is not full_res_timer:
+            return  # 취소 직전에 만료된 이전 타이머
+        full_res_timer = None
+        if running and binning_factor != PREVIEW_BINNING:
+            apply_binning(PREVIEW_BINNING)
 
 # =================== 조명 초기화 ===================
 def init_lights():
-    global light_clients
+    global light_clients, light_client_list, light_pool
     print("\n=== 조명 컨트롤러 연결 시작 ===")
     for port in LIGHT_PORTS:
         try:
-            client = ModbusSerialClient(port=port, baudrate=BAUDRATE, parity='N', stopbits=1, bytesize=8, timeout=0.1)
-            if client.connect():
-                light_clients[port] = client
-                print(f"✅ [{port}] 조명 연결 성공")
-            else:
-                print(f"❌ [{port}] 조명 연결 실패")
+            # pymodbus를 거치지 않고 포트를 직접 열어 raw 패킷만 씀
+            client = serial.Serial(port=port, baudrate=BAUDRATE, parity='N', stopbits=1, bytesize=8,
+                                   timeout=0.1, write_timeout=0.1)
+            light_clients[port] = client
+            print(f"✅ [{port}] 조명 연결 성공")
+        except serial.SerialException as e:
+            print(f"❌ [{port}] 조명 연결 실패: {e}")
         except Exception as e:
             print(f"⚠️ [{port}] 오류: {e}")
+    light_client_list = list(light_clients.values())
+    if light_client_list:
+        light_pool = ThreadPoolExecutor(max_workers=len(light_client_list))
     print("==============================\n")
 
 # =================== 조명 제어 ===================
+def write_light_packet(client, packet):
+    if client and client.is_open:
+        try:
+            client.write(packet)
+            client.flush()  # 송신 완료까지 대기 (시퀀스의 조명 안정화 대기가 실제 적용 시점부터 시작)
+        except:
+            pass
+
 def send_light_packet(val):
     if val < 0:
         val = 0
     if val > 255:
         val = 255
     app_state["light_value"] = val
-    val_bytes = f"{val:03d}".encode('ascii')
-    packet = b'\x02' + b'A' + (val_bytes + b',') * 3 + val_bytes + b'\x03'
-    for port, client in light_clients.items():
-        if client and client.connected:
-            try:
-                client.socket.write(packet)
-            except:
-                pass
+    # 모든 포트가 같은 패킷을 받으므로 동시에 쓰고 모두 끝날 때까지 대기 (전송 시간 = 가장 느린 포트 기준)
+    if light_pool:
+        list(light_pool.map(write_light_packet, light_client_list, repeat(LIGHT_PACKETS[val])))
 
 # =================== 카메라 프레임 가져오기 스레드 ===================
-def camera_thread():
-    global running, latest_frames
+class FrameRing:
+    """카메라 1대용 프레임 링. 미리 할당한 버퍼를 돌려 쓰고, 저장 대기 중인(참조된) 칸은 다시 쓰지 않음"""
+    __slots__ = ("shape", "base", "buf", "refs", "gen", "head", "lock")
+
+    def __init__(self, shape, size=FRAME_POOL_SIZE):
+        self.shape = shape
+        self.base = size        # 상시 유지하는 칸 수 (이후 칸은 저장 대기로 모자랄 때만 잠시 할당)
+        self.buf = [np.empty(shape, dtype=np.uint8) for _ in range(size)]
+        self.refs = [0] * size  # 칸별 저장 대기 참조 수 (0인 칸만 생산자가 재사용)
+        self.gen = [0] * size   # 칸별 쓰기 시작 횟수 (읽는 동안 바뀌면 덮어쓰인 것)
+        self.head = (0, -1)     # (게시된 프레임 수, 최신 칸). 튜플 한 번 대입으로 게시
+        self.lock = threading.Lock()  # 생산자의 칸 선택과 저장용 참조 획득/해제만 직렬화
+
+    @property
+    def seq(self):
+        return self.head[0]  # 0이면 아직 프레임 없음
+
+    def write_slot(self):
+        """생산자가 다음에 채울 칸 번호. 최신 칸과 참조 중인 칸은 건너뛰고, 기본 칸이 모두 사용 중일 때만 추가 칸 사용"""
+        latest = self.head[1]
+        with self.lock:
+            i = self._free_slot(latest)
+            if self.buf[i] is None:
+                self.buf[i] = np.empty(self.shape, dtype=np.uint8)
+            self.gen[i] += 1
+            self._trim(latest, i)
+        return i
+
+    def _free_slot(self, latest):
+        for k in range(1, self.base + 1):
+            i = (latest + k) % self.base
+            if i != latest and self.refs[i] == 0:
+                return i
+        for i in range(self.base, len(self.buf)):
+            if i != latest and self.refs[i] == 0:
+                return i
+        # 칸 번호는 저장 대기 항목이 들고 있으므로 목록은 줄이지 않고 버퍼만 None으로 해제/재할당
+        self.buf.append(None)
+        self.refs.append(0)
+        self.gen.append(0)
+        return len(self.buf) - 1
+
+    def _trim(self, *keep):
+        """참조가 끝난 추가 칸의 버퍼 해제 (메모리는 기본 칸 수 + 저장 대기 칸만큼만 유지)"""
+        for i in range(self.base, len(self.buf)):
+            if self.refs[i] == 0 and i not in keep:
+                self.buf[i] = None
+
+    def publish(self, i):
+        self.head = (self.head[0] + 1, i)
+
+    def read(self, use):
+        """최신 칸으로 use(img)를 실행. 그동안 생산자가 이 칸을 다시 쓰기 시작했으면 재시도 (락/대기 없음)"""
+        while True:
+            seq, i = self.head
+            if seq == 0:
+                return None
+            g = self.gen[i]
+            img = self.buf[i]
+            if self.head[0] != seq or img is None:
+                continue  # 읽기 전에 새 프레임이 게시됨 (이전 칸은 해제됐을 수 있음)
+            result = use(img)
+            if self.gen[i] == g:
+                return result
+
+    def acquire(self):
+        """최신 칸을 저장용으로 잡고 칸 번호 반환 (release 전까지 생산자가 덮어쓰지 않으므로 복사 불필요)"""
+        with self.lock:
+            seq, i = self.head
+            if seq == 0:
+                return None
+            self.refs[i] += 1
+            return i
+
+    def release(self, i):
+        with self.lock:
+            self.refs[i] -= 1
+            self._trim(self.head[1])
+
+def publish_frame(idx, grabResult):
+    """재사용 PylonImage로 변환 후 링 버퍼 칸에 복사하고 게시 (프레임마다 수 MB 배열 할당 없음)"""
+    global frame_rings
+    image = convert_targets[idx]
+    converters[idx].Convert(image, grabResult)
+    with image.GetArrayZeroCopy() as arr:
+        ring = frame_rings.get(idx)
+        if ring is None or ring.shape != arr.shape:
+            # 처음이거나 해상도가 바뀌면 새 링을 넣은 새 dict로 교체 (대입 한 번으로 게시)
+            ring = FrameRing(arr.shape)
+            with rings_lock:
+                frame_rings = {**frame_rings, idx: ring}
+        slot = ring.write_slot()
+        np.copyto(ring.buf[slot], arr)
+    ring.publish(slot)
+
+def grab_loop(idx, cam):
+    """카메라 1대 전용 그랩 쓰레드. 프레임이 올 때까지 RetrieveResult 안에서 대기 (고정 주기 폴링/sleep 없음)"""
     while running:
         try:
-            if cameras_available and cameras and camera_map:
-                for idx, cam in camera_map.items():
-                    if cam.IsGrabbing():
-                        grabResult = cam.RetrieveResult(50, pylon.TimeoutHandling_Return)
-                        if grabResult and grabResult.GrabSucceeded():
-                            image = converter.Convert(grabResult)
-                            with frame_lock:
-                                latest_frames[idx] = image.GetArray()
-                        if grabResult:
-                            grabResult.Release()
-            time.sleep(0.01)
+            request = binning_requests.pop(idx, None)
+            if request is not None:
+                switch_binning(idx, cam, *request)  # 전환 전 해상도의 결과는 이미 처리했으므로 이후 게시는 새 해상도만
+            if cam.IsGrabbing():
+                grabResult = cam.RetrieveResult(GRAB_TIMEOUT_MS, pylon.TimeoutHandling_Return)
+                if grabResult and grabResult.GrabSucceeded():
+                    publish_frame(idx, grabResult)
+                if grabResult:
+                    grabResult.Release()
+                continue
+            time.sleep(0.1)  # 그랩 중이 아니면 잠시 대기
         except Exception as e:
-            print(f"Camera Thread Error: {e}")
+            print(f"Camera {idx} Grab Error: {e}")
             time.sleep(0.1)
 
+def wait_for_new_frames(timeout=1.0):
+    """호출 이후에 게시된 프레임이 모든 카메라에 들어올 때까지 대기 (그 전에 찍힌 프레임 저장 방지)"""
+    rings = frame_rings
+    start = {idx: (rings.get(idx), rings[idx].seq if idx in rings else 0) for idx in camera_map}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rings = frame_rings
+        fresh = True
+        for idx, (ring, seq) in start.items():
+            cur = rings.get(idx)
+            # 링이 교체됐으면(비닝 전환) 새 링에 프레임이 하나라도 있으면 새 프레임
+            if cur is None or (cur is ring and cur.seq <= seq) or cur.seq == 0:
+                fresh = False
+                break
+        if fresh:
+            return True
+        time.sleep(0.005)
+    return False
+
 # =================== 이미지 인코딩 ===================
 def encode_frame(img):
-    """OpenCV 이미지를 base64로 인코딩"""
+    """OpenCV 이미지를 JPEG bytes로 인코딩 (바이너리 WebSocket 프레임으로 그대로 전송)"""
     if img is None:
         return None
-    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    return base64.b64encode(buffer).decode('utf-8')
+    if _tj is not None:
+        return _tj.encode(img, quality=JPEG_QUALITY, pixel_format=TJPF_BGR)  # bytes 바로 반환
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer.tobytes()
 
 # =================== 프리뷰 이미지 생성 ===================
+def resize_preview(raw_img):
+    h, w = raw_img.shape[:2]
+    if w == PREVIEW_SCALE_WIDTH:
+        return raw_img.copy()  # 비닝 결과가 이미 미리보기 크기 (글자는 링 밖의 복사본에 씀)
+    scale = PREVIEW_SCALE_WIDTH / w
+    size = (int(w * scale), int(h * scale))
+    if USE_OPENCL:
+        # 원본을 UMat으로 올려 GPU에서 축소한 뒤 작은 결과만 내려받음 (글자/JPEG 인코딩은 CPU)
+        return cv2.resize(cv2.UMat(raw_img), size).get()
+    return cv2.resize(raw_img, size)
+
+@lru_cache(maxsize=16)
+def preview_label(cam_id, will_save):
+    """미리보기 상단 문구와 색상 (카메라/저장 여부별로 한 번만 생성)"""
+    if will_save:
+        if cam_id == 3:
+            return "CAM 3 (ON)", (0, 255, 255)
+        return f"CAM {cam_id} (ON)", (0, 255, 0)
+    return f"CAM {cam_id} (OFF)", (128, 128, 128)
+
+@lru_cache(maxsize=16)
+def black_preview(cam_id, available):
+    """프레임이 없는 카메라용 검은 화면 JPEG (내용이 고정이므로 한 번만 그리고 인코딩)"""
+    black_img = np.zeros((300, PREVIEW_SCALE_WIDTH, 3), dtype=np.uint8)
+    if not available:
+        cv2.putText(black_img, f"CAM {cam_id} (No Camera)", (20, 150),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2)
+    else:
+        cv2.putText(black_img, f"CAM {cam_id} Off", (50, 150),
+                  cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
+    return encode_frame(black_img)
+
 def get_preview_images():
     """모든 카메라의 프리뷰 이미지를 생성"""
     previews = {}
     current_mode = app_state["save_mode"]
+    rings = frame_rings  # 이번 틱 동안 사용할 스냅샷
     
-    with frame_lock:
-        for cam_id in sorted(TARGET_CAMS):
-            if cam_id in latest_frames:
-                raw_img = latest_frames[cam_id]
-                h, w = raw_img.shape[:2]
-                scale = PREVIEW_SCALE_WIDTH / w
-                preview_img = cv2.resize(raw_img, (int(w * scale), int(h * scale)))
-                
-                will_save = True
-                if current_mode == 1 and cam_id == 3:
-                    will_save = False
-                if current_mode == 3 and cam_id != 3:
-                    will_save = False
-                
-                if will_save:
-                    if cam_id == 3:
-                        txt, color = "CAM 3 (ON)", (0, 255, 255)
-                    else:
-                        txt, color = f"CAM {cam_id} (ON)", (0, 255, 0)
-                else:
-                    txt, color = f"CAM {cam_id} (OFF)", (128, 128, 128)
-                
-                cv2.putText(preview_img, txt, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, color, 2)
-                previews[cam_id] = encode_frame(preview_img)
-            else:
-                # 검은 화면 생성
-                black_img = np.zeros((300, PREVIEW_SCALE_WIDTH, 3), dtype=np.uint8)
-                if not cameras_available:
-                    cv2.putText(black_img, f"CAM {cam_id} (No Camera)", (20, 150),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2)
-                else:
-                    cv2.putText(black_img, f"CAM {cam_id} Off", (50, 150),
-                              cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
-                previews[cam_id] = encode_frame(black_img)
-    
+    for cam_id in sorted(TARGET_CAMS):
+        ring = rings.get(cam_id)
+        if ring is None or ring.seq == 0:
+            previews[cam_id] = black_preview(cam_id, cameras_available)
+            continue
+        
+        will_save = True
+        if current_mode == 1 and cam_id == 3:
+            will_save = False
+        if current_mode == 3 and cam_id != 3:
+            will_save = False
+        
+        # 카메라가 새 프레임을 내지 않았고 문구도 같으면 지난 틱의 JPEG 재사용 (프리뷰 주기 > 카메라 FPS일 때)
+        key = (ring, ring.seq, will_save)
+        cached = preview_cache.get(cam_id)
+        if cached and cached[0] == key:
+            previews[cam_id] = cached[1]
+            continue
+        
+        # 링 버퍼에서 바로 축소 (축소본은 새 배열이므로 이후 글자/인코딩은 링과 무관)
+        preview_img = ring.read(resize_preview)
+        txt, color = preview_label(cam_id, will_save)
+        cv2.putText(preview_img, txt, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, color, 2)
+        previews[cam_id] = encode_frame(preview_img)
+        preview_cache[cam_id] = (key, previews[cam_id])
+
     return previews
 
+async def preview_producer():
+    """틱마다 프리뷰를 한 번만 생성/직렬화해 접속한 모든 WebSocket에 공유 (클라이언트 수와 무관한 인코딩 비용)"""
+    global latest_preview
+    while running:
+        try:
+            if active_websockets:
+                # 리사이즈/JPEG 인코딩은 CPU 작업이므로 워커 쓰레드에서 실행 (이벤트 루프 블로킹 방지)
+                previews = await asyncio.to_thread(get_preview_images)
+                # 헤더에는 카메라 순서와 JPEG 길이만 담고, JPEG는 base64 없이 하나의 바이너리 프레임으로 연결
+                order = sorted(previews)
+                jpegs = [previews[cam_id] or b"" for cam_id in order]
+                header = orjson.dumps({
+                    "type": "preview",
+                    "order": order,
+                    "sizes": [len(j) for j in jpegs],
+                    "timestamp": datetime.now().isoformat()
+                }).decode()
+                latest_preview = (header, b"".join(jpegs))  # 튜플 한 번에 교체 (헤더/본문 짝이 어긋나지 않음)
+                preview_event.set()
+                preview_event.clear()
+        except Exception as e:
+            print(f"Preview Producer Error: {e}")
+        await asyncio.sleep(0.033)  # 약 30 FPS
+
 # =================== 이미지 저장 ===================
 def save_snapshot_internal(light_val):
     if not cameras_available:
@@ -227,6 +530,7 @@ def save_snapshot_internal(light_val):
     cond2 = f"Light_{light_val:03d}"
     shot_no = app_state["shot_no"]
     mode = app_state["save_mode"]
+    save_format = app_state["save_format"]
     
     if not product or not cond1:
         return {"success": False, "message": "제품명과 검사 조건을 입력해주세요.", "saved_count": 0}
@@ -241,32 +545,62 @@ def save_snapshot_internal(light_val):
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
+    # 저장할 칸을 참조로 잡아 복사 없이 writer에 넘김 (writer가 release할 때까지 생산자가 재사용하지 않음)
     images_to_save = {}
-    with frame_lock:
+    with full_resolution():
+        rings = frame_rings  # 같은 촬영의 카메라들은 같은 스냅샷에서 읽음
         for cam_id in TARGET_CAMS:
-            if cam_id in latest_frames:
-                images_to_save[cam_id] = latest_frames[cam_id].copy()
+            if mode == 1 and cam_id == 3:
+                continue
+            elif mode == 3 and cam_id != 3:
+                continue
+            ring = rings.get(cam_id)
+            slot = ring.acquire() if ring else None
+            if slot is not None:
+                images_to_save[cam_id] = (ring, slot)
     
+    # 인코딩/쓰기는 save_writer 쓰레드가 처리하고 여기서는 큐에 넣고 바로 반환
     saved_count = 0
     saved_files = []
-    for cam_id, img in images_to_save.items():
-        if mode == 1 and cam_id == 3:
-            continue
-        elif mode == 3 and cam_id != 3:
-            continue
-        
-        filename = f"{product}_{cond1}_{cond2}_{shot_no:03d}_Cam{cam_id}_{timestamp}.png"
+    for cam_id, (ring, slot) in images_to_save.items():
+        filename = f"{product}_{cond1}_{cond2}_{shot_no:03d}_Cam{cam_id}_{timestamp}.{save_format}"
         filepath = os.path.join(path_cam3 if cam_id == 3 else path_std, filename)
-        
+        save_q.put((cam_id, filepath, ring, slot, save_format))
+        saved_count += 1
+        saved_files.append(filepath)
+    
+    return {"success": True, "saved_count": saved_count, "files": saved_files}
+
+def encode_image(img, save_format):
+    """저장용 인코딩 결과 버퍼 반환 (실패 시 None). jpg는 TurboJPEG가 있으면 사용, png는 압축 레벨 1"""
+    if save_format == "jpg":
+        if _tj is not None:
+            return _tj.encode(img, quality=SAVE_JPEG_QUALITY, pixel_format=TJPF_BGR)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, SAVE_JPEG_QUALITY])
+    else:
+        ok, buf = cv2.imencode('.png', img, PNG_PARAMS)
+    return buf if ok else None
+
+def save_writer():
+    """저장 큐에서 이미지를 꺼내 인코딩/기록 (None을 받으면 종료)"""
+    while True:
+        item = save_q.get()
+        if item is None:
+            break
+        cam_id, filepath, ring, slot, save_format = item
         try:
-            cv2.imwrite(filepath, img)
+            buf = encode_image(ring.buf[slot], save_format)  # 링 버퍼 칸에서 바로 인코딩
+            if buf is None:
+                print(f"Save error for cam {cam_id}: 인코딩 실패 ({filepath})")
+                continue  # finally에서 칸은 해제됨
+            # 파이썬 open으로 직접 기록 (cv2.imwrite는 Windows 한글 경로에서 실패)
+            with open(filepath, "wb") as f:
+                f.write(buf)
             print(f"saved: {filepath}")
-            saved_count += 1
-            saved_files.append(filepath)
         except Exception as e:
             print(f"Save error for cam {cam_id}: {e}")
-    
-    return {"success": True, "saved_count": saved_count, "files": saved_files}
+        finally:
+            ring.release(slot)
 
 # =================== Pydantic 모델 ===================
 class LightRequest(BaseModel):
@@ -278,6 +612,7 @@ class SettingsRequest(BaseModel):
     shot_no: Optional[int] = None
     save_path: Optional[str] = None
     save_mode: Optional[int] = None
+    save_format: Optional[str] = None
     sequence_start: Optional[int] = None
     sequence_end: Optional[int] = None
     sequence_step: Optional[int] = None
@@ -345,6 +680,11 @@ async def update_settings(settings: SettingsRequest):
             app_state["save_mode"] = settings.save_mode
         else:
             raise HTTPException(status_code=400, detail="save_mode는 1, 2, 3 중 하나여야 합니다.")
+    if settings.save_format is not None:
+        if settings.save_format in SAVE_FORMATS:
+            app_state["save_format"] = settings.save_format
+        else:
+            raise HTTPException(status_code=400, detail="save_format은 png, jpg 중 하나여야 합니다.")
     if settings.sequence_start is not None:
         app_state["sequence_start"] = settings.sequence_start
     if settings.sequence_end is not None:
@@ -383,7 +723,8 @@ async def set_light(light_req: LightRequest):
 async def capture_image():
     """현재 설정으로 1회 촬영"""
     current_light = app_state["light_value"]
-    result = save_snapshot_internal(current_light)
+    # 비닝 해제 대기가 있을 수 있으므로 이벤트 루프 밖에서 실행
+    result = await asyncio.to_thread(save_snapshot_internal, current_light)
     if result["success"] and result["saved_count"] > 0:
         app_state["shot_no"] += 1
     return result
@@ -412,12 +753,14 @@ async def start_sequence(seq_req: SequenceRequest):
     # 백그라운드에서 시퀀스 실행
     def run_sequence():
         offset = 1 if step_val > 0 else -1
-        for val in range(start_val, end_val + offset, step_val):
-            send_light_packet(val)
-            print(f"--- 조명 변경: {val} ---")
-            time.sleep(0.5)
-            save_snapshot_internal(val)
-            time.sleep(0.2)
+        with full_resolution():  # 시퀀스 동안 비닝 전환은 처음/끝 한 번씩만
+            for val in range(start_val, end_val + offset, step_val):
+                send_light_packet(val)  # 모든 포트 동시 전송, 쓰기 완료 후 반환
+                print(f"--- 조명 변경: {val} ---")
+                time.sleep(LIGHT_SETTLE_S)
+                # 안정화 이후 새로 들어온 프레임이 모든 카메라에 오면 바로 저장 (저장은 writer 쓰레드가 처리하므로 추가 대기 없음)
+                wait_for_new_frames()
+                save_snapshot_internal(val)
         app_state["shot_no"] += 1
     
     threading.Thread(target=run_sequence, daemon=True).start()
@@ -431,13 +774,11 @@ async def websocket_preview(websocket: WebSocket):
     
     try:
         while True:
-            previews = get_preview_images()
-            await websocket.send_json({
-                "type": "preview",
-                "cameras": previews,
-                "timestamp": datetime.now().isoformat()
-            })
-            await asyncio.sleep(0.033)  # 약 30 FPS
+            # preview_producer가 만든 페이로드를 그대로 전송 (클라이언트마다 다시 인코딩하지 않음)
+            await preview_event.wait()
+            header, body = latest_preview
+            await websocket.send_text(header)
+            await websocket.send_bytes(body)
     except WebSocketDisconnect:
         active_websockets.remove(websocket)
     except Exception as e:
@@ -448,12 +789,17 @@ async def websocket_preview(websocket: WebSocket):
 # =================== 시작 시 초기화 ===================
 @app.on_event("startup")
 async def startup_event():
+    global preview_task, save_writer_thread
     try:
         load_settings()  # 설정 파일 로드
         init_cameras()
         init_lights()
         send_light_packet(app_state["light_value"])
-        threading.Thread(target=camera_thread, daemon=True).start()
+        for idx, cam in camera_map.items():
+            threading.Thread(target=grab_loop, args=(idx, cam), daemon=True).start()
+        save_writer_thread = threading.Thread(target=save_writer, daemon=True)
+        save_writer_thread.start()
+        preview_task = asyncio.create_task(preview_producer())
         print("🚀 Vision System Web API 시작됨")
     except Exception as e:
         print(f"⚠️ 초기화 중 오류 발생 (서버는 계속 실행됩니다): {e}")
@@ -464,11 +810,20 @@ async def startup_event():
 async def shutdown_event():
     global running
     running = False
+    if full_res_timer is not None:
+        full_res_timer.cancel()
+    if preview_task:
+        preview_task.cancel()
+    if save_writer_thread:
+        save_q.put(None)  # 남은 저장을 마친 뒤 종료
+        save_writer_thread.join()
     if cameras_available and cameras:
         for cam in cameras:
             if cam.IsGrabbing():
                 cam.StopGrabbing()
             cam.Close()
+    if light_pool:
+        light_pool.shutdown(wait=True)
     for client in light_clients.values():
         client.close()
     print("🛑 Vision System Web API 종료됨")